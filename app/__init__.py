@@ -30,6 +30,35 @@ def create_app():
     Migrate(app, db)
     mail.init_app(app)
 
+    # Apply solver cache limits
+    from app.utils import diffusion_operator_cache, casadi_solver_cache
+    diffusion_operator_cache.configure(
+        max_entries=app.config["DIFFUSION_CACHE_MAX_ENTRIES"],
+        max_bytes=app.config["DIFFUSION_CACHE_MAX_BYTES"]
+    )
+    casadi_solver_cache.configure(max_entries=app.config["CASADI_CACHE_MAX_ENTRIES"])
+
+    from app.utils import result_cache
+    result_cache.configure(
+        max_entries=app.config["RESULT_CACHE_MAX_ENTRIES"],
+        max_bytes=app.config["RESULT_CACHE_MAX_BYTES"],
+        ttl=app.config["RESULT_CACHE_TTL"],
+        directory=app.config["RESULT_CACHE_DIR"],
+        disk_max_bytes=app.config["RESULT_CACHE_DISK_MAX_BYTES"]
+    )
+
+    from app.utils import run_checkpoints
+    run_checkpoints.configure(
+        directory=app.config["DIFFUSION_2D_CHECKPOINT_DIR"] or os.path.join(app.instance_path, "diffusion_2d_runs"),
+        interval=app.config["DIFFUSION_2D_CHECKPOINT_INTERVAL"],
+        ttl=app.config["DIFFUSION_2D_CHECKPOINT_TTL"],
+        max_runs=app.config["DIFFUSION_2D_MAX_RUNS"]
+    )
+
+    if app.config["DIFFUSION_BENCHMARK_ON_STARTUP"]:
+        from app.utils import diffusion_backends
+        diffusion_backends.benchmark()
+
     # Set session lifetime
     app.permanent_session_lifetime = Config.REMEMBER_COOKIE_DURATION
 
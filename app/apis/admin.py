@@ -5,6 +5,7 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import History, User
 from app.utils.decorators import admin_required
+from app.utils import diffusion_operator_cache, diffusion_backends, result_cache
 
 admin = Blueprint('admin', __name__)
 
@@ -34,6 +35,40 @@ def user(user_id):
 
     return jsonify({"user": user_data, "history": history_data}), 200
 
+@admin.route('/cache/diffusion', methods=['GET'])
+@admin_required
+def diffusion_cache_stats():
+    return jsonify(diffusion_operator_cache.stats()), 200
+
+@admin.route('/cache/diffusion', methods=['DELETE'])
+@admin_required
+def clear_diffusion_cache():
+    diffusion_operator_cache.clear()
+    return jsonify({"message": "Diffusion operator cache cleared"}), 200
+
+@admin.route('/cache/results', methods=['GET'])
+@admin_required
+def result_cache_stats():
+    return jsonify(result_cache.stats()), 200
+
+@admin.route('/cache/results', methods=['DELETE'])
+@admin_required
+def clear_result_cache():
+    result_cache.clear()
+    return jsonify({"message": "Result cache cleared"}), 200
+
+@admin.route('/diffusion/backends/benchmark', methods=['POST'])
+@admin_required
+def benchmark_diffusion_backends():
+    data = request.get_json(silent=True) or {}
+    try:
+        ns_values = [int(ns) for ns in data.get('ns', [10, 100, 1000, 10000])]
+        repeat = int(data.get('repeat', 3))
+    except (TypeError, ValueError):
+        return jsonify({"error": "ns must be a list of integers"}), 400
+    diffusion_backends.benchmark(ns_values, repeat)
+    return jsonify({"backends": diffusion_backends.describe()}), 200
+
 @admin.route('/register', methods=['POST'])
 @login_required
 def register():
@@ -1,21 +1,34 @@
-from flask import Blueprint, jsonify, request, Response
+from flask import Blueprint, jsonify, request, Response, stream_with_context, current_app
 from flask_login import login_required, current_user
 import json
 import inspect
+import time
 import io
 import csv
-import gzip
+import codecs
+import itertools
+import zlib
+import shutil
+import tempfile
 import numpy as np
 from app import db
-from app.models import History
-from app.utils import diffusion_solver, dynamic_router, diffusion_2d_solver, calculate_temperature_influence, diffusion_2d_solver_alt
+from app.models import History, User
+from app.utils import diffusion_backends, diffusion_solver, diffusion_solver_refined, diffusion_solver_nonlinear, diffusion_solver_transient, diffusion_solver_temperature_sweep, dynamic_router, diffusion_2d_solver, calculate_temperature_influence, diffusion_2d_frames, result_cache
 from app.utils.decorators import admin_required
-from app.utils.history import calculate_history_size
+from app.utils.history import calculate_history_size, stored_output_hashes, add_history_entries
+from app.utils.diffusion_batch import solve_diffusion_rows_parallel
 from app.utils.compiled import ecm_calculation
 from app.utils.ecm import ecm_interp_solution
+from app.utils.colormap import get_colormap
+from app.utils.solid_diffusion import FRAME_FORMATS
+from app.utils.run_checkpoint import run_checkpoints, RunInProgressError
+from app.utils.frame_codec import encode_frame_header, encode_record, encode_error_record, DeltaFrameEncoder, FRAME_MIMETYPE, KEYFRAME, END
 
 calculation = Blueprint('calculation', __name__)
 
+# Streamed batch uploads are held in memory up to this size, then on disk
+BATCH_SPOOL_SIZE = 1024 * 1024
+
 @calculation.route('/diffusion', methods=['POST'])
 @login_required
 def diffusion():
@@ -25,32 +38,88 @@ def diffusion():
     ns = data.get('ns')
     temp_influenced = data.get('temp_influenced')
     name = data.get('name')
+    backend = data.get('backend')
+    diffusivity = data.get('diffusivity')
+    mesh = data.get('mesh', 'uniform')
+    grading = data.get('grading', 10)
+    surface_tolerance = data.get('surface_tolerance')
 
     if d is None or r is None or ns is None:
         return jsonify({"error": "Missing required parameters"}), 400
+    if diffusivity is not None and not isinstance(diffusivity, dict):
+        return jsonify({"error": "diffusivity must be an object"}), 400
+    try:
+        grading = float(grading)
+    except (TypeError, ValueError):
+        grading = None
+    if grading is None or not grading > 0:
+        return jsonify({"error": "grading must be a positive number"}), 400
+    refined = mesh != 'uniform' or surface_tolerance is not None
+    if refined and backend not in (None, 'numpy'):
+        # Non-uniform meshes and grid refinement are only offered by the NumPy solver
+        return jsonify({"error": f"Backend {backend} does not support mesh or surface_tolerance"}), 400
 
     try:
         calculation_type = 'diffusion'
         if temp_influenced:
             d = calculate_temperature_influence(d)
             calculation_type = 'diffusion_temp_influenced'
-        # Run the diffusion solver function
-        rp_disc, cs_iter, loss_value = diffusion_solver(d, r, ns)
-
-        # Convert NumPy arrays to lists for JSON serialization
-        rp_disc = rp_disc.tolist()
-        cs_iter = cs_iter.tolist()
-        
-        # Prepare input and output for storage
+            if diffusivity is not None and diffusivity.get('type') == 'table':
+                diffusivity = {**diffusivity, 'd': calculate_temperature_influence(np.asarray(diffusivity['d'], dtype=float)).tolist()}
+        if diffusivity is not None:
+            if refined or backend is not None:
+                return jsonify({"error": "mesh, surface_tolerance and backend are not supported with diffusivity"}), 400
+            return nonlinear_diffusion(d, r, ns, diffusivity, calculation_type, name)
+        if data.get('t_end') is not None:
+            if refined or backend is not None:
+                return jsonify({"error": "mesh, surface_tolerance and backend are not supported with t_end"}), 400
+            return transient_diffusion(data, d, r, ns, calculation_type, name)
+        # Prepare input for storage
         input_data = {"d": d, "r": r, "ns": ns}
-        output_data = {
-            "rp_disc": rp_disc,
-            "cs_iter": cs_iter,
-            "loss_value": loss_value
-        }
+        if refined:
+            input_data.update({"mesh": mesh, "grading": grading})
+            if surface_tolerance is not None:
+                input_data["surface_tolerance"] = surface_tolerance
+
+        # Identical inputs give identical results, so reuse a previous solve when possible
+        cache_params = {**input_data, "backend": backend}
+        output_data = result_cache.get(calculation_type, cache_params)
+        cached = output_data is not None
+
+        elapsed = None
+        if not cached:
+            start = time.perf_counter()
+            try:
+                if refined:
+                    if surface_tolerance is not None:
+                        # ns is the finest grid the refinement may use
+                        rp_disc, cs_iter, loss_value, surface_error = diffusion_solver_refined(
+                            d, r, float(surface_tolerance), mesh, grading, ns_max=ns
+                        )
+                        backend_info = {"name": "numpy", "reason": "surface_tolerance",
+                                        "ns": len(rp_disc) - 1, "surface_error": float(surface_error)}
+                    else:
+                        rp_disc, cs_iter, loss_value = diffusion_solver(d, r, ns, mesh, grading)
+                        backend_info = {"name": "numpy", "reason": "mesh"}
+                else:
+                    # Run the diffusion solver on the requested or the fastest backend
+                    rp_disc, cs_iter, loss_value, backend_info = diffusion_backends.solve(d, r, ns, backend)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            # The solve time varies between runs, so it is kept next to the output, not in it
+            elapsed = time.perf_counter() - start
+
+            # Prepare output for storage, converting NumPy arrays to lists for JSON serialization
+            output_data = {
+                "rp_disc": rp_disc.tolist(),
+                "cs_iter": cs_iter.tolist(),
+                "loss_value": float(loss_value),
+                "backend": backend_info
+            }
+            result_cache.put(calculation_type, cache_params, output_data)
 
         # Calculate size of the history entry
-        history_size = calculate_history_size(input_data, output_data)
+        history_size = calculate_history_size(input_data, output_data, current_user.id)
 
         # Check if user has enough storage space
         if current_user.storage_used + history_size > current_user.storage_limit:
@@ -66,7 +135,8 @@ def diffusion():
             input=json.dumps(input_data),
             output=json.dumps(output_data),
             name=name if name else None,
-            size=history_size
+            size=history_size,
+            elapsed=elapsed
         )
         db.session.add(history_entry)
         
@@ -75,16 +145,177 @@ def diffusion():
         db.session.commit()
 
         # Return the output to the user
-        return jsonify({
-            "rp_disc": rp_disc,
-            "cs_iter": cs_iter,
-            "loss_value": loss_value
-        })
+        return jsonify({**output_data, "cached": cached, "elapsed": elapsed})
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
     
 
+def nonlinear_diffusion(d, r, ns, diffusivity, calculation_type, name):
+    """
+    Solve with a concentration-dependent diffusion coefficient and store the result.
+    """
+    try:
+        start = time.perf_counter()
+        rp_disc, cs_iter, loss_value = diffusion_solver_nonlinear(d, r, ns, diffusivity)
+        elapsed = time.perf_counter() - start
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid diffusivity: {str(e)}"}), 400
+
+    input_data = {"d": d, "r": r, "ns": ns, "diffusivity": diffusivity}
+    output_data = {
+        "rp_disc": rp_disc.tolist(),
+        "cs_iter": cs_iter.tolist(),
+        "loss_value": loss_value,
+        "backend": {"name": "numpy_nonlinear", "reason": "diffusivity"}
+    }
+
+    history_size = calculate_history_size(input_data, output_data, current_user.id)
+    if current_user.storage_used + history_size > current_user.storage_limit:
+        return jsonify({"error": "Storage limit exceeded"}), 400
+
+    history_entry = History(
+        user_id=current_user.id,
+        folder_id=current_user.default_folder_id,
+        type=calculation_type + '_nonlinear',
+        input=json.dumps(input_data),
+        output=json.dumps(output_data),
+        name=name if name else None,
+        size=history_size,
+        elapsed=elapsed
+    )
+    db.session.add(history_entry)
+    current_user.storage_used += history_size
+    db.session.commit()
+
+    return jsonify({**output_data, "elapsed": elapsed})
+
+
+@calculation.route('/diffusion/temperature_sweep', methods=['POST'])
+@login_required
+def diffusion_temperature_sweep():
+    """
+    Solve the diffusion problem for every temperature in T at once.
+
+    Returns a temperature x radius concentration matrix.
+    """
+    data = request.get_json()
+    d = data.get('d')
+    r = data.get('r')
+    ns = data.get('ns')
+    T = data.get('T')
+    Ea = data.get('Ea', 50000)
+    name = data.get('name')
+
+    if None in (d, r, ns, T):
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    try:
+        T = np.atleast_1d(np.asarray(T, dtype=float))
+        d, r, ns, Ea = float(d), float(r), int(ns), float(Ea)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Parameters must be numeric and T a list of temperatures"}), 400
+    if T.ndim != 1 or len(T) == 0 or np.any(T <= 0):
+        return jsonify({"error": "T must be a non-empty list of positive temperatures"}), 400
+
+    try:
+        d_T, rp_disc, cs_iter, loss_value = diffusion_solver_temperature_sweep(d, r, ns, T, Ea)
+
+        input_data = {"d": d, "r": r, "ns": ns, "T": T.tolist(), "Ea": Ea}
+        output_data = {
+            "T": T.tolist(),
+            "d": d_T.tolist(),
+            "rp_disc": rp_disc.tolist(),
+            "cs_iter": cs_iter.tolist(),
+            "loss_value": loss_value.tolist()
+        }
+
+        history_size = calculate_history_size(input_data, output_data, current_user.id)
+        if current_user.storage_used + history_size > current_user.storage_limit:
+            return jsonify({"error": "Storage limit exceeded"}), 400
+
+        history_entry = History(
+            user_id=current_user.id,
+            folder_id=current_user.default_folder_id,
+            type='diffusion_temperature_sweep',
+            input=json.dumps(input_data),
+            output=json.dumps(output_data),
+            name=name if name else None,
+            size=history_size
+        )
+        db.session.add(history_entry)
+        current_user.storage_used += history_size
+        db.session.commit()
+
+        return jsonify(output_data)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@calculation.route('/diffusion/backends', methods=['GET'])
+@login_required
+def list_diffusion_backends():
+    """
+    List the diffusion solver backends with their capabilities and benchmarks.
+    """
+    return jsonify({"backends": diffusion_backends.describe()}), 200
+
+
+def transient_diffusion(data, d, r, ns, calculation_type, name):
+    """
+    Stream a transient diffusion run as newline-delimited JSON.
+
+    The first line carries the radial grid, every following line one
+    concentration profile. The final profile is stored in History.
+    """
+    try:
+        t_end = float(data.get('t_end'))
+        dt = float(data.get('dt', 1))
+        output_every = int(data.get('output_every', 1))
+        adaptive = str(data.get('adaptive', '')).lower() in ['true', '1', 'yes']
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid transient parameters"}), 400
+    if t_end <= 0 or dt <= 0 or output_every < 1:
+        return jsonify({"error": "t_end and dt must be positive, output_every at least 1"}), 400
+
+    input_data = {"d": d, "r": r, "ns": ns, "t_end": t_end, "dt": dt,
+                  "output_every": output_every, "adaptive": adaptive}
+    rp_disc = np.linspace(0, r, ns + 1).tolist()
+
+    def generate():
+        yield json.dumps({"rp_disc": rp_disc}) + "\n"
+        try:
+            t, cs_iter = 0.0, None
+            for step, t, cs_iter in diffusion_solver_transient(d, r, ns, t_end, dt, output_every, adaptive):
+                yield json.dumps({"step": step, "t": t, "cs_iter": cs_iter.tolist()}) + "\n"
+
+            # The request's session is closed once the view returns, so load the user again
+            user = User.query.get(current_user.id)
+            output_data = {"rp_disc": rp_disc, "cs_iter": cs_iter.tolist(), "t": t}
+            history_size = calculate_history_size(input_data, output_data, user.id)
+            if user.storage_used + history_size > user.storage_limit:
+                yield json.dumps({"error": "Storage limit exceeded"}) + "\n"
+                return
+            history_entry = History(
+                user_id=user.id,
+                folder_id=user.default_folder_id,
+                type=calculation_type + '_transient',
+                input=json.dumps(input_data),
+                output=json.dumps(output_data),
+                name=name if name else None,
+                size=history_size
+            )
+            db.session.add(history_entry)
+            user.storage_used += history_size
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @calculation.route("/<function_name>", methods=["POST"])
 @login_required
 def call_dynamic_function(function_name):
@@ -176,6 +407,115 @@ def update_function_visibility():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+def parse_batch_row(row):
+    """
+    Parse one CSV row of a batch upload into (calculation_type, params).
+
+    Raises ValueError for malformed values.
+    """
+    params = {
+        'd': float(row['d']),
+        'r': float(row['r']),
+        'ns': int(row['ns']),
+        'temp_influenced': row['temp_influenced'].lower() in ['true', '1', 'yes']
+    }
+
+    calculation_type = 'diffusion'
+    if params['temp_influenced']:
+        params['d'] = calculate_temperature_influence(params['d'])
+        calculation_type = 'diffusion_temp_influenced'
+
+    # Only use the first 3 parameters
+    params = {k: v for k, v in params.items() if k in ['d', 'r', 'ns']}
+    return calculation_type, params
+
+
+def batch_history_entry(calculation_type, params, output_str, charged, user):
+    """
+    Build the History columns for one batch result from its JSON output,
+    returns (entry, size), see add_history_entries.
+
+    charged holds the hashes of the outputs the user is already charged for.
+    """
+    input_str = json.dumps(params)
+    entry_size = calculate_history_size(input_str, output_str, charged=charged)
+    history_entry = {
+        "user_id": user.id,
+        "folder_id": user.default_folder_id,
+        "type": calculation_type,
+        "input": input_str,
+        "output": output_str,
+        "size": entry_size
+    }
+    return history_entry, entry_size
+
+
+def stream_batch_diffusion(reader, upload):
+    """
+    Stream batch results as newline-delimited JSON, one line per row.
+
+    Rows are read and solved a window at a time, so the upload is never held
+    in memory. History entries are written in bulk and committed in one
+    transaction once every row is solved, so shared outputs are not locked
+    while the response is sent; any error discards them.
+    """
+    workers = current_app.config['DIFFUSION_BATCH_WORKERS']
+    chunk_size = current_app.config['DIFFUSION_BATCH_CHUNK_SIZE']
+    window = chunk_size * max(workers, 1)
+
+    def generate():
+        # The request's session is closed once the view returns, so load the user again
+        user = User.query.get(current_user.id)
+        total_size = 0
+        count = 0
+        charged = stored_output_hashes(user.id)
+        history_entries = []
+        try:
+            while True:
+                rows = []
+                for row in itertools.islice(reader, window):
+                    try:
+                        rows.append((reader.line_num, *parse_batch_row(row)))
+                    except ValueError as e:
+                        db.session.rollback()
+                        yield json.dumps({"error": f"error in line {reader.line_num}: {str(e)}"}) + "\n"
+                        return
+                if not rows:
+                    break
+
+                outputs = solve_diffusion_rows_parallel([params for _, _, params in rows], workers, chunk_size)
+                for (line_num, calculation_type, params), output_data in zip(rows, outputs):
+                    if "error" in output_data:
+                        db.session.rollback()
+                        yield json.dumps({"error": f"error in line {line_num}: {output_data['error']}"}) + "\n"
+                        return
+
+                    output_str = json.dumps(output_data)
+                    history_entry, entry_size = batch_history_entry(calculation_type, params, output_str, charged, user)
+                    total_size += entry_size
+                    if user.storage_used + total_size > user.storage_limit:
+                        db.session.rollback()
+                        yield json.dumps({"error": "Storage limit exceeded"}) + "\n"
+                        return
+                    history_entries.append(history_entry)
+                    count += 1
+
+                    # Reuse the serialized output for the line
+                    yield f'{{"line": {line_num}, {output_str[1:]}\n'
+
+            add_history_entries(history_entries)
+            user.storage_used += total_size
+            db.session.commit()
+            yield json.dumps({"done": True, "count": count}) + "\n"
+        except Exception as e:
+            db.session.rollback()
+            yield json.dumps({"error": f"Error: {str(e)}"}) + "\n"
+        finally:
+            upload.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @calculation.route('/diffusion/batch', methods=['POST'])
 @login_required
 def batch_diffusion():
@@ -187,81 +527,203 @@ def batch_diffusion():
         return jsonify({"error": "Only support csv"}), 400
 
     try:
-        stream = io.StringIO(file.stream.read().decode('UTF-8'))
-        reader = csv.DictReader(stream)
+        streamed = str(request.form.get('stream', '')).lower() in ['true', '1', 'yes']
+        streamed = streamed or 'application/x-ndjson' in request.headers.get('Accept', '')
+        upload = file.stream
+        if streamed:
+            # The request's files are closed before a streamed response is
+            # consumed, so the rows are read from a copy owned by the response
+            upload = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_SIZE)
+            shutil.copyfileobj(file.stream, upload)
+            upload.seek(0)
+
+        # Parse the upload incrementally, decoding it line by line
+        reader = csv.DictReader(codecs.iterdecode(upload, 'utf-8'))
         
         required_columns = {'d', 'r', 'ns', 'temp_influenced'}
-        if not required_columns.issubset(reader.fieldnames):
-            missing = required_columns - set(reader.fieldnames)
+        if reader.fieldnames is None or not required_columns.issubset(reader.fieldnames):
+            missing = required_columns - set(reader.fieldnames or [])
             return jsonify({"error": f"missing: {', '.join(missing)}"}), 400
 
-        results = []
-        total_size = 0
-        history_entries = []
+        if streamed:
+            return stream_batch_diffusion(reader, upload)
 
+        rows = []
         for row in reader:
             try:
-                params = {
-                    'd': float(row['d']),
-                    'r': float(row['r']),
-                    'ns': int(row['ns']),
-                    'temp_influenced': row['temp_influenced'].lower() in ['true', '1', 'yes']
-                }
+                rows.append((reader.line_num, *parse_batch_row(row)))
             except ValueError as e:
                 return jsonify({"error": f"error in line {reader.line_num}: {str(e)}"}), 400
 
-            try:
-                calculation_type = 'diffusion'
-                if params['temp_influenced']:
-                    params['d'] = calculate_temperature_influence(params['d'])
-                    calculation_type = 'diffusion_temp_influenced'
-                
-                # Only use the first 3 parameters
-                params = {k: v for k, v in params.items() if k in ['d', 'r', 'ns']}
-                rp_disc, cs_iter, loss_value = diffusion_solver(**params)
-                
-                output_data = {
-                    "rp_disc": rp_disc.tolist(),
-                    "cs_iter": cs_iter.tolist(),
-                    "loss_value": loss_value
-                }
+        # Rows sharing a grid size are solved together, optionally on worker processes
+        outputs = solve_diffusion_rows_parallel(
+            [params for _, _, params in rows],
+            current_app.config['DIFFUSION_BATCH_WORKERS'],
+            current_app.config['DIFFUSION_BATCH_CHUNK_SIZE']
+        )
 
-                # Calculate size for this entry
-                entry_size = calculate_history_size(params, output_data)
-                total_size += entry_size
-
-                history_entry = History(
-                    user_id=current_user.id,
-                    folder_id=current_user.default_folder_id,
-                    type=calculation_type,
-                    input=json.dumps(params),
-                    output=json.dumps(output_data),
-                    size=entry_size
-                )
-                history_entries.append(history_entry)
-                
-                results.append(output_data)
-            except Exception as e:
+        results = []
+        total_size = 0
+        history_entries = []
+        charged = stored_output_hashes(current_user.id)
+
+        for (line_num, calculation_type, params), output_data in zip(rows, outputs):
+            if "error" in output_data:
                 db.session.rollback()
-                return jsonify({"error": f"error in line {reader.line_num}: {str(e)}"}), 500
+                return jsonify({"error": f"error in line {line_num}: {output_data['error']}"}), 500
+
+            # Calculate size for this entry; the output is serialized once for History and the response
+            output_str = json.dumps(output_data)
+            history_entry, entry_size = batch_history_entry(calculation_type, params, output_str, charged, current_user)
+            total_size += entry_size
+            history_entries.append(history_entry)
+
+            results.append(output_str)
 
         # Check if user has enough storage space for all entries
         if current_user.storage_used + total_size > current_user.storage_limit:
+            db.session.rollback()
             return jsonify({"error": "Storage limit exceeded"}), 400
 
         # Add all history entries and update user storage
-        for entry in history_entries:
-            db.session.add(entry)
+        add_history_entries(history_entries)
         current_user.storage_used += total_size
         db.session.commit()
 
-        return jsonify({"results": results}), 200
+        return Response('{"results": [' + ','.join(results) + ']}', status=200, mimetype='application/json')
 
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Error: {str(e)}"}), 500
     
 
+def diffusion_2d_metadata(nx, ny, nt, scheme, colormap, times, frame_format):
+    """
+    Describe a 2D run. Scalar frame formats carry the colormap as its
+    lookup table, so clients colorize frames exactly as the server would.
+    """
+    metadata = {"nx": nx, "ny": ny, "timesteps": nt, "scheme": scheme,
+                "colormap": colormap, "times": times, "frame_format": frame_format}
+    if frame_format != 'rgb':
+        metadata["lut"] = get_colormap(colormap).tolist()
+        metadata["value_range"] = [-1, 1]
+    return metadata
+
+
+def encode_diffusion_2d(frames, metadata, binary, content_encoding, codec='raw', keyframe_interval=30):
+    """
+    Encode 2D frames as the chunks of a response body: the binary transport
+    format, gzipped if content_encoding is set, or the gzipped JSON document.
+
+    frames may be an array, a memory-mapped frame file or a generator of
+    frames; they are encoded one at a time, so the run is never read into
+    memory as a whole.
+    """
+    if binary:
+        frame_shape, dtype = FRAME_FORMATS[metadata["frame_format"]]
+        encode = DeltaFrameEncoder(keyframe_interval).encode if codec == 'delta' else np.ndarray.tobytes
+        shape = (len(metadata["times"]), metadata["nx"], metadata["ny"]) + frame_shape
+        chunks = itertools.chain(
+            [encode_frame_header(metadata, dtype, shape, codec, keyframe_interval)],
+            (encode(frame) for frame in frames)
+        )
+        # Frames compress well even at the fastest level
+        compressor = zlib.compressobj(1, zlib.DEFLATED, 31) if content_encoding else None
+    else:
+        chunks = itertools.chain(
+            ['{"metadata":' + json.dumps(metadata, separators=(',', ':')) + ',"frames":['],
+            ((',' if k else '') + json.dumps(frame.tolist(), separators=(',', ':')) for k, frame in enumerate(frames)),
+            [']}']
+        )
+        chunks = (chunk.encode() for chunk in chunks)
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+
+    if compressor is None:
+        yield from chunks
+        return
+    for chunk in chunks:
+        chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def diffusion_2d_response(body, binary, content_encoding):
+    """
+    Send a body built by encode_diffusion_2d, either joined into bytes or as
+    its chunks, which are then encoded while the response is sent.
+    """
+    headers = {
+        'Content-Type': FRAME_MIMETYPE if binary else 'application/json',
+        'Vary': 'Accept, Accept-Encoding'
+    }
+    if isinstance(body, bytes):
+        headers['Content-Length'] = len(body)
+    if content_encoding:
+        headers['Content-Encoding'] = content_encoding
+    return Response(
+        body,
+        headers=headers,
+        direct_passthrough=True
+    ), 200
+
+
+def stream_diffusion_2d(metadata, frame_iter, binary, content_encoding, codec='raw', keyframe_interval=30):
+    """
+    Stream 2D frames as they are computed.
+
+    In binary mode the body is the binary transport format, header first and
+    then each frame as it arrives, as a keyframe or delta record depending on
+    codec, gzipped incrementally if content_encoding is set. It ends with an
+    END record, or an ERROR record if the run fails. Otherwise it is newline-delimited JSON: a metadata line followed
+    by one {"t", "frame"} line per frame.
+    """
+    nx, ny = metadata["nx"], metadata["ny"]
+    frame_shape, dtype = FRAME_FORMATS[metadata["frame_format"]]
+
+    def generate_binary():
+        compressor = zlib.compressobj(1, zlib.DEFLATED, 31) if content_encoding else None
+        if codec == 'delta':
+            encode = DeltaFrameEncoder(keyframe_interval).encode
+        else:
+            def encode(frame):
+                return encode_record(KEYFRAME, frame.tobytes())
+
+        def records():
+            yield encode_frame_header(metadata, dtype, (len(metadata["times"]), nx, ny) + frame_shape, codec,
+                                      keyframe_interval, streamed=True)
+            try:
+                for frame in frame_iter:
+                    yield encode(frame)
+            except Exception as e:
+                yield encode_error_record(str(e))
+                return
+            yield encode_record(END)
+
+        for chunk in records():
+            if compressor:
+                # Flush every frame so the client can show it right away
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield chunk
+        if compressor:
+            yield compressor.flush()
+
+    def generate_ndjson():
+        yield json.dumps({"metadata": metadata}) + "\n"
+        try:
+            for t, frame in zip(metadata["times"], frame_iter):
+                yield json.dumps({"t": t, "frame": frame.tolist()}, separators=(',', ':')) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    if binary:
+        headers = {'Vary': 'Accept, Accept-Encoding'}
+        if content_encoding:
+            headers['Content-Encoding'] = content_encoding
+        return Response(stream_with_context(generate_binary()), mimetype=FRAME_MIMETYPE, headers=headers)
+    return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+
+
 @calculation.route('/diffusion_2d', methods=['POST'])
 @login_required
 def diffusion_2d():
@@ -271,32 +733,155 @@ def diffusion_2d():
     dt = data.get('dt')
     d = data.get('d')
     t_max = data.get('t_max')
+    scheme = data.get('scheme', 'explicit')
+    colormap = data.get('colormap', 'bwr')
+    frame_format = data.get('frame_format', 'rgb')
 
     if None in {nx, ny, dt, d, t_max}:
         return jsonify({"error": "Missing required parameters"}), 400
+    if scheme not in ['explicit', 'adi']:
+        return jsonify({"error": "scheme must be 'explicit' or 'adi'"}), 400
+    if frame_format not in FRAME_FORMATS:
+        return jsonify({"error": f"frame_format must be one of {', '.join(FRAME_FORMATS)}"}), 400
+    try:
+        output_every = int(data.get('output_every', 1))
+        # Frames are bounded server side whatever the client asks for
+        max_frames = min(int(data.get('max_frames', current_app.config['DIFFUSION_2D_MAX_FRAMES'])),
+                         current_app.config['DIFFUSION_2D_MAX_FRAMES'])
+        keyframe_interval = int(data.get('keyframe_interval', 30))
+    except (TypeError, ValueError):
+        return jsonify({"error": "output_every, max_frames and keyframe_interval must be integers"}), 400
+    if output_every < 1 or max_frames < 1 or keyframe_interval < 1:
+        return jsonify({"error": "output_every, max_frames and keyframe_interval must be at least 1"}), 400
+    try:
+        get_colormap(colormap)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Raw frames are sent when the client accepts them, otherwise the gzipped JSON document
+    binary = FRAME_MIMETYPE in request.headers.get('Accept', '')
+    content_encoding = 'gzip' if binary and 'gzip' in request.headers.get('Accept-Encoding', '') else None
+    # Long runs change little between frames; the delta codec only sends what changed
+    codec = data.get('codec', 'raw')
+    if codec not in ['raw', 'delta']:
+        return jsonify({"error": "codec must be 'raw' or 'delta'"}), 400
+    if codec == 'delta' and not binary:
+        return jsonify({"error": f"The delta codec requires Accept: {FRAME_MIMETYPE}"}), 400
+    if codec == 'raw':
+        keyframe_interval = None
+
+    # Runs with a run_id are checkpointed, resume where a previous request stopped
+    # and keep their frames for /diffusion_2d/<run_id>/frames, so they are always run
+    run_id = data.get('run_id')
+    tracked = run_id is not None and run_checkpoints.enabled
+
+    # The encoded response only depends on the inputs, so reuse it when possible
+    run_params = {"nx": nx, "ny": ny, "dt": dt, "d": d, "t_max": t_max, "scheme": scheme,
+                  "output_every": output_every, "max_frames": max_frames, "colormap": colormap,
+                  "frame_format": frame_format}
+    cache_params = {**run_params, "binary": binary, "content_encoding": content_encoding,
+                    "codec": codec, "keyframe_interval": keyframe_interval}
+    body = None if tracked else result_cache.get('diffusion_2d', cache_params)
+    streamed = str(data.get('stream', '')).lower() in ['true', '1', 'yes']
+    # A cached binary body holds every frame, so it is sent in place of the stream
+    computed = body is None or (streamed and not binary)
+
+    checkpoint = None
+    if tracked:
+        # The frame file counts against the user's storage until the run is removed
+        info, _ = diffusion_2d_frames(nx, ny, dt, d, t_max, scheme, output_every, max_frames, colormap,
+                                      frame_format=frame_format)
+        run_size = (len(info["times"]) * int(np.prod(info["frame_shape"])) * np.dtype(info["dtype"]).itemsize
+                    + nx * ny * np.dtype(float).itemsize)
+        try:
+            checkpoint = run_checkpoints.open(current_user.id, str(run_id), run_params, run_size,
+                                              current_user.storage_limit - current_user.storage_used)
+        except RunInProgressError as e:
+            return jsonify({"error": str(e)}), 409
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    if streamed and computed:
+        info, frame_iter = diffusion_2d_frames(nx, ny, dt, d, t_max, scheme, output_every, max_frames, colormap,
+                                               checkpoint, frame_format,
+                                               current_app.config['DIFFUSION_2D_WORKERS'])
+        metadata = diffusion_2d_metadata(nx, ny, info["nt"], scheme, colormap, info["times"], frame_format)
+        return stream_diffusion_2d(metadata, frame_iter, binary, content_encoding, codec, keyframe_interval)
+
+    if body is None:
+        info, frame_iter = diffusion_2d_frames(nx, ny, dt, d, t_max, scheme, output_every, max_frames, colormap,
+                                               checkpoint, frame_format,
+                                               current_app.config['DIFFUSION_2D_WORKERS'])
+        metadata = diffusion_2d_metadata(nx, ny, info["nt"], scheme, colormap, info["times"], frame_format)
+        if tracked:
+            # Run to the end, then send the frames from the run's frame file one at a time
+            for _ in frame_iter:
+                pass
+            body = encode_diffusion_2d(checkpoint.frames, metadata, binary, content_encoding, codec, keyframe_interval)
+        else:
+            # Encode the frames as they are computed, without keeping them
+            body = b''.join(encode_diffusion_2d(frame_iter, metadata, binary, content_encoding, codec,
+                                                keyframe_interval))
+            print(f"size after compression in mb: {len(body) / 1024 / 1024}")
+            result_cache.put('diffusion_2d', cache_params, body)
 
-    # try:
-    frames, nt, nx, ny = diffusion_2d_solver_alt(nx, ny, dt, d, t_max)
+    return diffusion_2d_response(body, binary, content_encoding)
 
-    response_data = {
-        "metadata": {"nx": nx, "ny": ny, "timesteps": nt},
-        "frames": np.round(frames, decimals=4).tolist()
-    }
-    
-    compressed = gzip.compress(
-        json.dumps(response_data, separators=(',', ':')).encode(),
-        compresslevel=9
-    )
-    print(f"size after compression in mb: {len(compressed) / 1024 / 1024}")
-    return Response(
-        compressed,
-        headers={
-            # 'Content-Encoding': 'gzip',
-            'Content-Type': 'application/json',
-            'Content-Length': len(compressed)
-        },
-        direct_passthrough=True
-    ), 200
+@calculation.route('/diffusion_2d/<run_id>/frames', methods=['GET'])
+@login_required
+def diffusion_2d_run_frames(run_id):
+    """
+    Fetch frames of a run started with a run_id by index, so clients can seek
+    without holding the whole run.
+
+    The query parameters start, stop and step select frames as a Python
+    slice would, among the frames computed so far; metadata['frame_count']
+    tells how many that is and metadata['indices'] which were returned.
+    Frames are sent in the run's frame_format, with the transports of
+    /diffusion_2d except streaming.
+    """
+    stored = run_checkpoints.read_frames(current_user.id, run_id)
+    if stored is None:
+        return jsonify({"error": f"Run {run_id} not found"}), 404
+    frames, state, params = stored
+
+    try:
+        start = request.args.get('start')
+        stop = request.args.get('stop')
+        step = int(request.args.get('step', 1))
+        start = int(start) if start not in [None, ''] else None
+        stop = int(stop) if stop not in [None, ''] else None
+        keyframe_interval = int(request.args.get('keyframe_interval', 30))
+    except ValueError:
+        return jsonify({"error": "start, stop, step and keyframe_interval must be integers"}), 400
+    if step < 1 or keyframe_interval < 1:
+        return jsonify({"error": "step and keyframe_interval must be at least 1"}), 400
+    selected = range(*slice(start, stop, step).indices(state["frame_count"]))
+    if len(selected) > current_app.config['DIFFUSION_2D_MAX_FRAMES']:
+        return jsonify({"error": f"At most {current_app.config['DIFFUSION_2D_MAX_FRAMES']} frames per request"}), 400
+
+    binary = FRAME_MIMETYPE in request.headers.get('Accept', '')
+    content_encoding = 'gzip' if binary and 'gzip' in request.headers.get('Accept-Encoding', '') else None
+    codec = request.args.get('codec', 'raw')
+    if codec not in ['raw', 'delta'] or (codec == 'delta' and not binary):
+        return jsonify({"error": f"codec must be 'raw', or 'delta' with Accept: {FRAME_MIMETYPE}"}), 400
+
+    times = state["times"]
+    metadata = diffusion_2d_metadata(params["nx"], params["ny"], state["nt"], params["scheme"], params["colormap"],
+                                     [times[i] for i in selected], params["frame_format"])
+    metadata.update({"run_id": run_id, "indices": list(selected), "frame_count": state["frame_count"],
+                     "total_frames": len(times)})
+    # Only the selected frames are read from the memory-mapped frame file
+    frames = frames[selected.start:selected.stop:selected.step] if len(selected) else frames[:0]
+    body = encode_diffusion_2d(frames, metadata, binary, content_encoding, codec, keyframe_interval)
+    return diffusion_2d_response(body, binary, content_encoding)
+
+@calculation.route('/diffusion_2d/<run_id>', methods=['DELETE'])
+@login_required
+def delete_diffusion_2d_run(run_id):
+    """Discard the checkpoint and frames of a 2D run"""
+    run_checkpoints.delete(current_user.id, run_id)
+    return jsonify({"message": f"Run {run_id} deleted"}), 200
 
 @calculation.route('/ecm', methods=['POST'])
 @login_required
@@ -338,37 +923,7 @@ def ecm():
             except Exception as e:
                 return jsonify({"error": f"Invalid OCV data format: {str(e)}"}), 400
 
-        if intepolation_choice not in ['linear', 'cubic', 'nearest']:
-            # Prepare input parameters for calculation
-            calc_parameters = {
-                't_tot': float(t_tot),
-                'dt': float(dt),
-                'OCV_import': ocv_data if ocv_data is not None else np.array([]),
-                'Cn': float(Cn),
-                'SOC_0': float(SOC_0),
-                'i_app': float(i_app),
-            }
-
-            # Run the ECM calculation
-            result = ecm_calculation(calc_parameters)
-        else:
-            result = ecm_interp_solution(
-                t_tot=float(t_tot),
-                dt=float(dt),
-                Cn=float(Cn),
-                SOC_0=float(SOC_0),
-                i_app=float(i_app),
-                intepolation_choice=intepolation_choice,
-                OCV_import=ocv_data if ocv_data is not None else np.array([])
-            )
-
-        # Extract results
-        t_table = result['t_table'].tolist()
-        Vt = result['Vt'].tolist()
-        SOC_store = result['SOC_store'].tolist()
-        OCV_store = result['OCV_store'].tolist()
-
-        # Prepare input and output for storage
+        # Prepare input for storage
         input_data = {
             't_tot': float(t_tot),
             'dt': float(dt),
@@ -378,15 +933,47 @@ def ecm():
             'i_app': float(i_app),
             'intepolation_choice': intepolation_choice
         }
-        output_data = {
-            "t_table": t_table,
-            "Vt": Vt,
-            "SOC_store": SOC_store,
-            "OCV_store": OCV_store
-        }
+
+        # Identical inputs give identical results, so reuse a previous run when possible
+        output_data = result_cache.get('ecm', input_data)
+        cached = output_data is not None
+
+        if not cached:
+            if intepolation_choice not in ['linear', 'cubic', 'nearest']:
+                # Prepare input parameters for calculation
+                calc_parameters = {
+                    't_tot': float(t_tot),
+                    'dt': float(dt),
+                    'OCV_import': ocv_data if ocv_data is not None else np.array([]),
+                    'Cn': float(Cn),
+                    'SOC_0': float(SOC_0),
+                    'i_app': float(i_app),
+                }
+
+                # Run the ECM calculation
+                result = ecm_calculation(calc_parameters)
+            else:
+                result = ecm_interp_solution(
+                    t_tot=float(t_tot),
+                    dt=float(dt),
+                    Cn=float(Cn),
+                    SOC_0=float(SOC_0),
+                    i_app=float(i_app),
+                    intepolation_choice=intepolation_choice,
+                    OCV_import=ocv_data if ocv_data is not None else np.array([])
+                )
+
+            # Prepare output for storage
+            output_data = {
+                "t_table": result['t_table'].tolist(),
+                "Vt": result['Vt'].tolist(),
+                "SOC_store": result['SOC_store'].tolist(),
+                "OCV_store": result['OCV_store'].tolist()
+            }
+            result_cache.put('ecm', input_data, output_data)
 
         # Calculate size of the history entry
-        history_size = calculate_history_size(input_data, output_data)
+        history_size = calculate_history_size(input_data, output_data, current_user.id)
 
         # Check if user has enough storage space
         if current_user.storage_used + history_size > current_user.storage_limit:
@@ -411,12 +998,7 @@ def ecm():
         db.session.commit()
 
         # Return the output to the user
-        return jsonify({
-            "t_table": t_table,
-            "Vt": Vt,
-            "SOC_store": SOC_store,
-            "OCV_store": OCV_store
-        })
+        return jsonify({**output_data, "cached": cached})
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
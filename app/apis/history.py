@@ -3,7 +3,7 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import History, User, Folder
 from sqlalchemy.exc import IntegrityError
-from app.utils.history import calculate_history_size
+from app.utils.history import calculate_history_size, delete_history_entry
 import json
 
 history = Blueprint('history', __name__)
@@ -62,8 +62,7 @@ def update_name(history_id):
 @login_required
 def delete_history(history_id):
     history = History.query.filter_by(id=history_id, user_id=current_user.id).first_or_404()
-    current_user.storage_used -= history.size
-    db.session.delete(history)
+    delete_history_entry(history)
     db.session.commit()
     return jsonify({'message': 'History deleted'}), 200
 
@@ -80,8 +79,10 @@ def get_storage():
 def recalculate_storage():
     try:
         # Get all histories for the current user
-        histories = History.query.filter_by(user_id=current_user.id).all()
+        histories = History.query.filter_by(user_id=current_user.id).order_by(History.id).all()
         total_size = 0
+        # Each distinct output is only counted once
+        charged = set()
         
         # Recalculate size for each history entry
         for history_entry in histories:
@@ -91,7 +92,7 @@ def recalculate_storage():
                 output_data = json.loads(history_entry.output)
                 
                 # Calculate new size
-                new_size = calculate_history_size(input_data, output_data)
+                new_size = calculate_history_size(input_data, output_data, charged=charged)
                 
                 # Update the history entry's size
                 history_entry.size = new_size
@@ -183,8 +184,7 @@ def delete_folder(folder_id):
             delete_folder_recursive(sub_folder)
 
         for history in History.query.filter_by(folder_id=folder.id, user_id=current_user.id).all():
-            current_user.storage_used -= history.size
-            db.session.delete(history)
+            delete_history_entry(history)
 
         db.session.delete(folder)
 
@@ -1,3 +1,4 @@
 from .user import User
 from .history import History
+from .history_output import HistoryOutput
 from .folder import Folder
\ No newline at end of file
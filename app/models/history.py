@@ -1,5 +1,10 @@
+from itertools import chain
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import flag_modified
 from app import db
 from datetime import datetime, timezone
+from app.models.history_output import HistoryOutput
 
 class History(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -8,12 +13,38 @@ class History(db.Model):
     name = db.Column(db.String(255), nullable=True)
     type = db.Column(db.String(255), nullable=True)
     input = db.Column(db.Text)
-    output = db.Column(db.Text)
+    # Outputs are stored in HistoryOutput; the column only holds rows written before that
+    _output = db.Column('output', db.Text)
+    output_hash = db.Column(db.String(64), db.ForeignKey('history_output.hash', name="fk_history_output"), index=True, nullable=True)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.now(timezone.utc))
     size = db.Column(db.Integer, default=0, nullable=True)
+    # Solve time in seconds; kept out of the output, which is shared between identical results
+    elapsed = db.Column(db.Float, nullable=True)
+
+    output_ref = db.relationship('HistoryOutput')
+    # Output assigned since the last flush; stored in HistoryOutput when flushed
+    _pending_output = None
+
+    @property
+    def output(self):
+        if self._pending_output is not None:
+            return self._pending_output
+        if self.output_ref is not None:
+            return self.output_ref.data
+        return self._output
+
+    @output.setter
+    def output(self, value):
+        if self.output_hash is not None:
+            self.output_ref.release()
+            self.output_hash = None
+            object_session(self).expire(self, ['output_ref'])
+        self._pending_output = value
+        self._output = None
+        # Flushing the row stores the output, see _store_pending_outputs
+        flag_modified(self, '_output')
 
     def to_dict(self):
-        print(f"calculation_type: {self.type}")
         return {
             'id': self.id,
             'folder_id': self.folder_id,
@@ -22,5 +53,22 @@ class History(db.Model):
             'input': self.input,
             'output': self.output,
             'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'size': self.size
-        }
\ No newline at end of file
+            'size': self.size,
+            'elapsed': self.elapsed
+        }
+
+
+@event.listens_for(Session, 'before_flush')
+def _store_pending_outputs(session, flush_context, instances):
+    """
+    Store the outputs assigned to History rows since the last flush, once
+    per distinct output, and point the rows at them.
+    """
+    pending = [obj for obj in chain(session.new, session.dirty)
+               if isinstance(obj, History) and obj._pending_output is not None]
+    if not pending:
+        return
+    hashes = HistoryOutput.acquire_many(session, [history._pending_output for history in pending])
+    for history, output_hash in zip(pending, hashes):
+        history.output_hash = output_hash
+        history._pending_output = None
@@ -0,0 +1,82 @@
+import hashlib
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+# Rows per upsert statement, within SQLite's limit of 999 bound parameters
+UPSERT_BATCH_SIZE = 200
+
+class HistoryOutput(db.Model):
+    """
+    A calculation output stored once per distinct content and shared by all
+    History rows holding byte-identical output, keyed on its SHA-256 hash.
+    """
+    hash = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text)
+    size = db.Column(db.Integer, default=0)
+    ref_count = db.Column(db.Integer, default=0)
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def acquire_many(cls, session, values):
+        """
+        Take a reference to the stored output of every value in values,
+        creating the outputs that do not exist yet. Returns their hashes.
+
+        Every distinct output is inserted or its count raised once, by the
+        number of values holding it, in bulk statements; each row is inserted
+        or counted by a single statement, so concurrent requests storing the
+        same new output neither collide on the primary key nor lose references.
+        """
+        hashes = [cls.digest(data) for data in values]
+        rows = {}
+        for output_hash, data in zip(hashes, values):
+            row = rows.get(output_hash)
+            if row is None:
+                rows[output_hash] = {"hash": output_hash, "data": data, "size": len(data.encode('utf-8')), "ref_count": 1}
+            else:
+                row["ref_count"] += 1
+        rows = list(rows.values())
+
+        # Executed on the connection, as this runs while the session is being flushed
+        connection = session.connection()
+        insert = _UPSERT_INSERTS.get(connection.dialect.name)
+        if insert is not None:
+            for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+                statement = insert(cls).values(rows[start:start + UPSERT_BATCH_SIZE])
+                connection.execute(statement.on_conflict_do_update(
+                    index_elements=[cls.hash], set_={"ref_count": cls.ref_count + statement.excluded.ref_count}
+                ))
+        else:
+            # Without ON CONFLICT, insert in a savepoint and count the references if the row exists
+            for row in rows:
+                try:
+                    with connection.begin_nested():
+                        connection.execute(db.insert(cls).values(**row))
+                except IntegrityError:
+                    connection.execute(db.update(cls).where(cls.hash == row["hash"])
+                                       .values(ref_count=cls.ref_count + row["ref_count"]))
+        return hashes
+
+    def release(self):
+        """
+        Drop a reference, deleting the output once no History row uses it.
+
+        The row is only deleted by a statement that checks the count itself,
+        so a reference taken concurrently keeps it alive.
+        """
+        db.session.execute(
+            db.update(HistoryOutput).where(HistoryOutput.hash == self.hash)
+            .values(ref_count=HistoryOutput.ref_count - 1),
+            execution_options={"synchronize_session": False}
+        )
+        db.session.execute(
+            db.delete(HistoryOutput).where(HistoryOutput.hash == self.hash, HistoryOutput.ref_count <= 0),
+            execution_options={"synchronize_session": False}
+        )
+        db.session.expire(self)
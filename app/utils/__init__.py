@@ -1,5 +1,11 @@
 from .solid_diffusion import diffusion_solver, diffusion_solver_casadi, calculate_temperature_influence
-from .solid_diffusion import diffusion_2d_solver, diffusion_2d_solver_alt
+from .solid_diffusion import diffusion_solver_batch, diffusion_solver_transient, diffusion_solver_nonlinear
+from .solid_diffusion import diffusion_solver_temperature_sweep, diffusion_solver_refined, radial_mesh
+from .solid_diffusion import diffusion_2d_solver, diffusion_2d_solver_alt, diffusion_2d_frames
 from .dynamic_router import dynamic_router
+from .diffusion_backends import diffusion_backends
+from .operator_cache import diffusion_operator_cache, casadi_solver_cache
+from .result_cache import result_cache
+from .run_checkpoint import run_checkpoints
 from .upload import save_uploaded_file, validate_python_file, convert_to_serializable
 from .intepolation import intepolation_cubic, intepolation_linear, intepolation_nearest
\ No newline at end of file
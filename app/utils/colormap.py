@@ -0,0 +1,113 @@
+import numpy as np
+import matplotlib
+
+# Number of entries in every lookup table; fields in [-1, 1] are split into
+# this many equal bins, so 0 falls on the boundary between the two halves
+LUT_SIZE = 256
+
+
+def _bwr(v):
+    """
+    The original map of the 2D solver: blue to white for negative values,
+    white to red for the rest.
+    """
+    rgb = np.empty(v.shape + (3,))
+    negative = v < 0
+    rgb[..., 0] = np.where(negative, 255 * np.abs(v), 255)
+    rgb[..., 1] = np.where(negative, 255 * np.abs(v), 255 * (1 - v))
+    rgb[..., 2] = np.where(negative, 255, 255 * (1 - v))
+    return rgb
+
+
+def _gray(v):
+    """
+    Black at -1 to white at 1.
+    """
+    return np.repeat((255 * (v + 1) / 2)[..., None], 3, axis=-1)
+
+
+def build_lut(func):
+    """
+    Evaluate a colormap at the bin centers of [-1, 1].
+
+    func takes an array of values and returns RGB values in [0, 255] with a
+    trailing axis of length 3. Returns a (LUT_SIZE, 3) uint8 array.
+    """
+    centers = -1 + (np.arange(LUT_SIZE) + 0.5) * 2 / LUT_SIZE
+    return np.clip(func(centers), 0, 255).astype(np.uint8)
+
+
+colormaps = {}
+
+
+def register_colormap(name, func):
+    """
+    Register a colormap under name, see build_lut for the form of func.
+    """
+    colormaps[name] = build_lut(func)
+
+
+def get_colormap(name):
+    """
+    Get the lookup table of a registered colormap, falling back to the
+    matplotlib colormap of that name.
+    """
+    if name not in colormaps:
+        try:
+            cmap = matplotlib.colormaps[name]
+        except KeyError:
+            raise ValueError(f"Unknown colormap {name}")
+        register_colormap(name, lambda v: 255 * cmap((v + 1) / 2)[..., :3])
+    return colormaps[name]
+
+
+class Quantizer:
+    """
+    Maps fields in [-1, 1] of a fixed shape to their lookup table bin, the
+    index floor((u + 1) * LUT_SIZE / 2) with u = 1 in the last bin.
+
+    The uint8 bins are the compact scalar form of a frame: any client holding
+    the lookup table colorizes them exactly as Colorizer does.
+    """
+    def __init__(self, shape):
+        self._scaled = np.empty(shape)
+
+    def __call__(self, u, out=None):
+        """
+        Quantize u into out, a uint8 array of shape u.shape unless given.
+        """
+        if out is None:
+            out = np.empty(u.shape, dtype=np.uint8)
+        np.multiply(u, LUT_SIZE / 2, out=self._scaled)
+        self._scaled += LUT_SIZE / 2
+        np.clip(self._scaled, 0, LUT_SIZE - 1, out=self._scaled)
+        np.copyto(out, self._scaled, casting='unsafe')
+        return out
+
+
+class Colorizer:
+    """
+    Maps fields in [-1, 1] of a fixed shape to RGB through a lookup table.
+
+    The bin index and scratch buffers are allocated once, so colorizing a
+    frame is a few in-place array operations and one table lookup.
+    """
+    def __init__(self, shape, colormap='bwr'):
+        self.lut = get_colormap(colormap)
+        self._quantize = Quantizer(shape)
+        self._index = np.empty(shape, dtype=np.intp)
+
+    def __call__(self, u, out=None):
+        """
+        Colorize u into out, a uint8 array of shape u.shape + (3,), which is
+        allocated when not given.
+        """
+        if out is None:
+            out = np.empty(u.shape + (3,), dtype=np.uint8)
+        self._quantize(u, out=self._index)
+        np.take(self.lut, self._index, axis=0, out=out)
+        return out
+
+
+register_colormap('bwr', _bwr)
+register_colormap('gray', _gray)
@@ -0,0 +1,144 @@
+import math
+import threading
+import time
+from functools import partial
+from app.utils.solid_diffusion import diffusion_solver, diffusion_solver_casadi
+
+
+class DiffusionBackendRegistry:
+    """
+    A registry of solver backends for the 1D spherical diffusion problem.
+
+    Every backend takes (d, r, ns) and returns (rp_disc, cs_iter, loss_value).
+    Backends are benchmarked on demand; the fastest capable backend for the
+    nearest benchmarked grid size is picked automatically.
+    """
+    def __init__(self):
+        self.backends = {}
+        self.benchmarks = {}  # name -> {ns: seconds per solve}
+        self._lock = threading.Lock()
+
+    def register_backend(self, name, func, max_ns=None, priority=0, description=""):
+        """
+        Register a backend. max_ns bounds the grid sizes it accepts; priority
+        orders backends when no benchmark is available (higher first).
+        """
+        if name in self.backends:
+            raise ValueError(f"Backend {name} is already registered.")
+        self.backends[name] = {
+            "func": func,
+            "max_ns": max_ns,
+            "priority": priority,
+            "description": description
+        }
+
+    def capable(self, name, ns):
+        max_ns = self.backends[name]["max_ns"]
+        return max_ns is None or ns <= max_ns
+
+    def benchmark(self, ns_values=(10, 100, 1000, 10000), repeat=3, d=1e-12, r=5e-6):
+        """
+        Time every capable backend on each grid size, keeping the best of
+        `repeat` runs after one warm-up call (which builds cached operators).
+        """
+        results = {}
+        for name, backend in self.backends.items():
+            timings = {}
+            for ns in ns_values:
+                if not self.capable(name, ns):
+                    continue
+                try:
+                    backend["func"](d, r, ns)
+                    best = math.inf
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        backend["func"](d, r, ns)
+                        best = min(best, time.perf_counter() - start)
+                    timings[ns] = best
+                except Exception as e:
+                    print(f"Benchmark of backend {name} failed for ns={ns}: {str(e)}")
+            results[name] = timings
+        with self._lock:
+            self.benchmarks = results
+        return results
+
+    def select(self, ns):
+        """
+        Pick the backend for ns, returns (name, reason).
+        """
+        candidates = [name for name in self.backends if self.capable(name, ns)]
+        if not candidates:
+            raise ValueError(f"No backend supports ns={ns}")
+
+        with self._lock:
+            benchmarks = dict(self.benchmarks)
+        timed = {}
+        for name in candidates:
+            timings = benchmarks.get(name)
+            if not timings:
+                continue
+            # Use the timing of the benchmarked size closest to ns on a log scale
+            nearest = min(timings, key=lambda n: abs(math.log(n) - math.log(max(ns, 1))))
+            timed[name] = (abs(math.log(nearest) - math.log(max(ns, 1))), timings[nearest])
+        if timed:
+            closest = min(distance for distance, _ in timed.values())
+            timed = {name: seconds for name, (distance, seconds) in timed.items() if distance == closest}
+            return min(timed, key=timed.get), "benchmark"
+
+        return max(candidates, key=lambda name: self.backends[name]["priority"]), "default"
+
+    def solve(self, d, r, ns, backend=None):
+        """
+        Solve with the given backend, or the selected one when backend is None.
+
+        Returns (rp_disc, cs_iter, loss_value, info), where info records the
+        backend, why it was chosen and its benchmark timings, if any.
+        """
+        if backend is None:
+            name, reason = self.select(ns)
+        elif backend not in self.backends:
+            raise ValueError(f"Backend {backend} is not registered.")
+        elif not self.capable(backend, ns):
+            raise ValueError(f"Backend {backend} does not support ns={ns}")
+        else:
+            name, reason = backend, "requested"
+
+        rp_disc, cs_iter, loss_value = self.backends[name]["func"](d, r, ns)
+        info = {"name": name, "reason": reason}
+        with self._lock:
+            timings = dict(self.benchmarks.get(name, {}))
+        if timings:
+            info["benchmark"] = {str(n): seconds for n, seconds in sorted(timings.items())}
+        return rp_disc, cs_iter, loss_value, info
+
+    def describe(self):
+        """
+        List the backends with their capabilities and latest benchmark.
+        """
+        with self._lock:
+            benchmarks = dict(self.benchmarks)
+        return [
+            {
+                "name": name,
+                "max_ns": backend["max_ns"],
+                "priority": backend["priority"],
+                "description": backend["description"],
+                "benchmark": {str(ns): seconds for ns, seconds in benchmarks.get(name, {}).items()}
+            }
+            for name, backend in self.backends.items()
+        ]
+
+
+diffusion_backends = DiffusionBackendRegistry()
+diffusion_backends.register_backend(
+    "numpy", diffusion_solver, priority=10,
+    description="Cached sparse LU factorization, O(ns) per solve"
+)
+diffusion_backends.register_backend(
+    "casadi_newton", partial(diffusion_solver_casadi, method="newton"), max_ns=20000, priority=5,
+    description="Compiled CasADi rootfinder (Newton)"
+)
+diffusion_backends.register_backend(
+    "casadi_ipopt", partial(diffusion_solver_casadi, method="ipopt"), max_ns=5000, priority=0,
+    description="Compiled CasADi least-squares problem solved with IPOPT"
+)
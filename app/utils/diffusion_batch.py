@@ -0,0 +1,119 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.utils.operator_cache import diffusion_operator_cache
+from app.utils.solid_diffusion import diffusion_solver, diffusion_solver_batch
+
+# Upper bound on the number of unknowns stacked into one banded solve
+MAX_BATCH_UNKNOWNS = 2000000
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _output(rp_disc, cs_iter, loss_value):
+    return {
+        "rp_disc": rp_disc.tolist(),
+        "cs_iter": cs_iter.tolist(),
+        "loss_value": float(loss_value)
+    }
+
+
+def solve_diffusion_rows(rows):
+    """
+    Solve a list of {'d', 'r', 'ns'} parameter sets.
+
+    Rows sharing a grid size are solved together with diffusion_solver_batch.
+    Returns one output dict per row, in input order; a row that fails is
+    reported as {"error": message}.
+    """
+    results = [None] * len(rows)
+    groups = {}
+    for index, row in enumerate(rows):
+        groups.setdefault(row['ns'], []).append(index)
+
+    for ns, indices in groups.items():
+        chunk_size = max(1, MAX_BATCH_UNKNOWNS // max(ns + 1, 1))
+        for start in range(0, len(indices), chunk_size):
+            chunk = indices[start:start + chunk_size]
+            if len(chunk) > 1:
+                try:
+                    rp_disc, cs_iter, loss_value = diffusion_solver_batch(
+                        [rows[i]['d'] for i in chunk],
+                        [rows[i]['r'] for i in chunk],
+                        ns
+                    )
+                    for k, i in enumerate(chunk):
+                        results[i] = _output(rp_disc[k], cs_iter[k], loss_value[k])
+                    continue
+                except Exception:
+                    # Solve row by row so the failing row can be reported
+                    pass
+
+            for i in chunk:
+                try:
+                    results[i] = _output(*diffusion_solver(rows[i]['d'], rows[i]['r'], ns))
+                except Exception as e:
+                    results[i] = {"error": str(e)}
+
+    return results
+
+
+def _init_worker(max_entries, max_bytes):
+    # Workers start from a fresh interpreter, so they build their own operator cache
+    diffusion_operator_cache.configure(max_entries=max_entries, max_bytes=max_bytes)
+
+
+def _get_executor(workers):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # Forking a threaded web worker can copy a lock held by another thread
+            # (the operator caches have one) into the child, where it is never released
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(method),
+                initializer=_init_worker,
+                initargs=(diffusion_operator_cache.max_entries, diffusion_operator_cache.max_bytes)
+            )
+            _executor_workers = workers
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+
+
+def solve_diffusion_rows_parallel(rows, workers, chunk_size=256):
+    """
+    Solve rows on a pool of worker processes.
+
+    Contiguous chunks of rows are dispatched to the workers, each solved with
+    solve_diffusion_rows, and the results are returned in input order. With
+    fewer than two workers, or a single chunk, the rows are solved in the
+    calling process.
+    """
+    chunk_size = max(1, int(chunk_size))
+    if workers is None or workers < 2 or len(rows) <= chunk_size:
+        return solve_diffusion_rows(rows)
+
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    results = []
+    try:
+        # map yields chunk results in submission order
+        for chunk_results in _get_executor(workers).map(solve_diffusion_rows, chunks):
+            results.extend(chunk_results)
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool for the next request
+        _reset_executor()
+        raise
+    return results
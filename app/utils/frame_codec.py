@@ -0,0 +1,204 @@
+import json
+import struct
+import numpy as np
+
+# Media type of the binary frame format, selected with the Accept header
+FRAME_MIMETYPE = 'application/x-diffusion-frames'
+FRAME_MAGIC = b'DFRM'
+
+FRAME_CODECS = ['raw', 'delta']
+
+# Record types of the delta codec
+KEYFRAME = 0
+DELTA = 1
+# Record types ending a streamed body, see encode_frame_header
+ERROR = 2
+END = 3
+
+
+def encode_frames(frames, metadata, codec='raw', keyframe_interval=30):
+    """
+    Pack frames into the binary transport format.
+
+    Layout: the 4 byte magic b'DFRM', a little-endian uint32 header length,
+    the UTF-8 JSON header (metadata plus the dtype, shape and codec of the
+    frames), then the frames. With the 'raw' codec the frames follow as one
+    C-ordered buffer; with 'delta' as records, see DeltaFrameEncoder.
+
+    Args:
+        frames: array of shape (n_frames, nx, ny, 3) or (n_frames, nx, ny)
+        metadata: JSON-serializable dict describing the run
+        codec: 'raw' or 'delta'
+        keyframe_interval: frames between forced keyframes of the delta codec
+    """
+    frames = np.ascontiguousarray(frames)
+    header = encode_frame_header(metadata, frames.dtype, frames.shape, codec, keyframe_interval)
+    if codec == 'raw':
+        return header + frames.tobytes()
+    encoder = DeltaFrameEncoder(keyframe_interval)
+    return header + b''.join(encoder.encode(frame) for frame in frames)
+
+
+def encode_frame_header(metadata, dtype, shape, codec='raw', keyframe_interval=30, streamed=False):
+    """
+    Build the magic, length and JSON header of the binary transport format.
+
+    The frames can then be sent one at a time, each as its raw bytes or its
+    delta record, for example while they are being computed.
+
+    A streamed header announces a body whose frames are all records, raw
+    frames being sent as keyframes, ending with an END record or, if the run
+    failed, an ERROR record holding the UTF-8 JSON {"error": message}. A body
+    cut short before either is incomplete.
+    """
+    if codec not in FRAME_CODECS:
+        raise ValueError(f"Unknown frame codec {codec}")
+    header = {
+        **metadata,
+        "dtype": np.dtype(dtype).name,
+        "shape": list(shape),
+        "codec": codec
+    }
+    if codec == 'delta':
+        header["keyframe_interval"] = keyframe_interval
+    if streamed:
+        header["streamed"] = True
+    header = json.dumps(header, separators=(',', ':')).encode()
+    return FRAME_MAGIC + struct.pack('<I', len(header)) + header
+
+
+def encode_record(record_type, payload=b''):
+    """
+    Build a record: a uint8 type, a little-endian uint32 payload length and the payload.
+    """
+    return struct.pack('<BI', record_type, len(payload)) + payload
+
+
+def encode_error_record(message):
+    """
+    Build the ERROR record ending a failed stream.
+    """
+    return encode_record(ERROR, json.dumps({"error": message}).encode())
+
+
+def _encode_varints(values):
+    """
+    LEB128-encode an array of non-negative integers below 2**35: seven bits
+    per byte, low bits first, the high bit set on all but the last byte.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.intp)
+    for bits in (7, 14, 21, 28):
+        lengths += values >= (1 << bits)
+    offsets = np.cumsum(lengths) - lengths
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for k in range(int(lengths.max(initial=0))):
+        present = lengths > k
+        more = (lengths[present] > k + 1).astype(np.uint8) << 7
+        out[offsets[present] + k] = ((values[present] >> np.uint64(7 * k)) & np.uint64(0x7f)).astype(np.uint8) | more
+    return out.tobytes()
+
+
+def _decode_varints(data):
+    """
+    Decode a buffer of LEB128 integers, see _encode_varints.
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if not len(data):
+        return np.empty(0, dtype=np.intp)
+    last = (data & 0x80) == 0
+    group = np.cumsum(last) - last
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    shifts = np.arange(len(data)) - starts[group]
+    parts = (data & 0x7f).astype(np.uint64) << (7 * shifts).astype(np.uint64)
+    values = np.zeros(len(starts), dtype=np.uint64)
+    np.add.at(values, group, parts)
+    return values.astype(np.intp)
+
+
+class DeltaFrameEncoder:
+    """
+    Encodes a sequence of frames as keyframes and deltas to the previous frame.
+
+    Every frame becomes a record: a uint8 type and a little-endian uint32
+    payload length, then the payload. A keyframe payload is the raw frame. A
+    delta payload is the uint32 byte length of the run table, the run table
+    and the new values of the changed pixels. The run table lists the runs
+    of changed pixels as varint (gap, pixel count) pairs, the gap counting
+    the unchanged pixels since the end of the previous run. A keyframe is written every keyframe_interval frames, so players
+    can seek, and whenever it is smaller than the delta.
+    """
+    def __init__(self, keyframe_interval=30):
+        if keyframe_interval < 1:
+            raise ValueError("keyframe_interval must be at least 1")
+        self.keyframe_interval = keyframe_interval
+        self._previous = None
+        self._count = 0
+
+    def encode(self, frame):
+        pixels = np.ascontiguousarray(frame).reshape(frame.shape[0] * frame.shape[1], -1)
+        record_type, payload = KEYFRAME, pixels.tobytes()
+
+        if self._previous is not None and self._count % self.keyframe_interval:
+            changed = np.any(pixels != self._previous, axis=1)
+            # Runs start where changed switches on and end where it switches off
+            edges = np.flatnonzero(np.diff(changed, prepend=False, append=False))
+            runs = np.empty((len(edges) // 2, 2), dtype=np.intp)
+            runs[:, 0] = np.diff(edges, prepend=0)[0::2]
+            runs[:, 1] = edges[1::2] - edges[0::2]
+            table = _encode_varints(runs.ravel())
+            delta = struct.pack('<I', len(table)) + table + pixels[changed].tobytes()
+            if len(delta) < len(payload):
+                record_type, payload = DELTA, delta
+
+        if self._previous is None:
+            self._previous = pixels.copy()
+        else:
+            np.copyto(self._previous, pixels)
+        self._count += 1
+        return encode_record(record_type, payload)
+
+
+def decode_frames(data):
+    """
+    Unpack the binary transport format, returns (frames, header).
+    """
+    if data[:4] != FRAME_MAGIC:
+        raise ValueError("Not a diffusion frame buffer")
+    header_length, = struct.unpack('<I', data[4:8])
+    header = json.loads(data[8:8 + header_length])
+    offset = 8 + header_length
+    streamed = header.get("streamed", False)
+    if header.get("codec", "raw") == "raw" and not streamed:
+        frames = np.frombuffer(data, dtype=header["dtype"], offset=offset).reshape(header["shape"])
+        return frames, header
+
+    frames = np.empty(header["shape"], dtype=header["dtype"])
+    channels = header["shape"][3] if len(header["shape"]) > 3 else 1
+    # A streamed body has one more record, its END record
+    for k in range(header["shape"][0] + (1 if streamed else 0)):
+        if offset + 5 > len(data):
+            raise ValueError("Truncated frame buffer")
+        record_type, length = struct.unpack('<BI', data[offset:offset + 5])
+        payload = data[offset + 5:offset + 5 + length]
+        offset += 5 + length
+        if record_type == ERROR:
+            raise ValueError(json.loads(payload)["error"])
+        if k == header["shape"][0]:
+            if record_type != END:
+                raise ValueError("Frame stream not terminated")
+            break
+        pixels = frames[k].reshape(-1, channels)
+        if record_type == KEYFRAME:
+            pixels[:] = np.frombuffer(payload, dtype=header["dtype"]).reshape(pixels.shape)
+            continue
+        pixels[:] = frames[k - 1].reshape(-1, channels)
+        table_length, = struct.unpack('<I', payload[:4])
+        runs = _decode_varints(payload[4:4 + table_length]).reshape(-1, 2)
+        values = np.frombuffer(payload, dtype=header["dtype"], offset=4 + table_length).reshape(-1, channels)
+        ends = np.cumsum(runs.ravel())[1::2]
+        position = 0
+        for end, count in zip(ends, runs[:, 1]):
+            pixels[end - count:end] = values[position:position + count]
+            position += count
+    return frames, header
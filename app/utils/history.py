@@ -1,13 +1,81 @@
 import json
+from app import db
+from app.models import History, HistoryOutput
 
-def calculate_history_size(input_data, output_data):
-    """Calculate the total size of history entry in bytes"""
+def calculate_history_size(input_data, output_data, user_id=None, charged=None):
+    """
+    Calculate the total size of history entry in bytes.
+
+    Outputs are stored once per distinct content, so the output only counts
+    when the user does not store an identical one yet. Pass user_id to check
+    the user's stored outputs, or charged, a set of output hashes already
+    counted (see stored_output_hashes), which is updated in place.
+    """
     # Convert to string if not already
     input_str = input_data if isinstance(input_data, str) else json.dumps(input_data)
     output_str = output_data if isinstance(output_data, str) else json.dumps(output_data)
-    
+
     # Calculate size in bytes
     input_size = len(input_str.encode('utf-8'))
     output_size = len(output_str.encode('utf-8'))
-    
-    return input_size + output_size 
\ No newline at end of file
+
+    if user_id is not None or charged is not None:
+        output_hash = HistoryOutput.digest(output_str)
+        if charged is not None:
+            if output_hash in charged:
+                output_size = 0
+            charged.add(output_hash)
+        elif History.query.filter_by(user_id=user_id, output_hash=output_hash).first() is not None:
+            output_size = 0
+
+    return input_size + output_size
+
+
+def stored_output_hashes(user_id):
+    """Get the hashes of all outputs the user already stores"""
+    rows = db.session.query(History.output_hash).filter_by(user_id=user_id).distinct()
+    return {output_hash for output_hash, in rows if output_hash is not None}
+
+
+def add_history_entries(entries):
+    """
+    Insert many History rows in one pass, for batch uploads.
+
+    entries are dicts of History columns with the JSON output under
+    'output'. Every distinct output is stored or counted once, then the rows
+    are inserted in bulk without building ORM objects.
+    """
+    if not entries:
+        return
+    hashes = HistoryOutput.acquire_many(db.session, [entry['output'] for entry in entries])
+    db.session.execute(db.insert(History), [
+        {**{key: value for key, value in entry.items() if key != 'output'}, 'output_hash': output_hash}
+        for entry, output_hash in zip(entries, hashes)
+    ])
+
+
+def delete_history_entry(history):
+    """
+    Delete a history entry, releasing its output and its storage.
+
+    If the entry carried the charge for an output the user still stores in
+    other entries, the charge moves to one of them.
+    """
+    user = history.user
+    user.storage_used -= history.size
+    output_ref = history.output_ref
+    if output_ref is not None:
+        input_size = len((history.input or '').encode('utf-8'))
+        if history.size >= input_size + output_ref.size:
+            heir = History.query.filter(
+                History.user_id == history.user_id,
+                History.output_hash == output_ref.hash,
+                History.id != history.id
+            ).first()
+            if heir is not None:
+                heir.size += output_ref.size
+                user.storage_used += output_ref.size
+        db.session.delete(history)
+        output_ref.release()
+    else:
+        db.session.delete(history)
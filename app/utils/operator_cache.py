@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+
+
+class OperatorCache:
+    """
+    A bounded LRU cache for precomputed discretization operators.
+
+    Entries are evicted in least-recently-used order once either the number
+    of entries or their (approximate) total size in bytes exceeds the limit.
+    """
+    def __init__(self, max_entries=64, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_entries=None, max_bytes=None):
+        """
+        Update the limits and evict entries that no longer fit.
+        """
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = int(max_entries)
+            if max_bytes is not None:
+                self.max_bytes = int(max_bytes)
+            self._evict()
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        """
+        Store value under key. Values larger than the byte limit are not cached.
+        """
+        with self._lock:
+            if nbytes > self.max_bytes or self.max_entries <= 0:
+                return
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            self._evict()
+
+    def get_or_create(self, key, factory):
+        """
+        Return the cached value for key, building it with factory() on a miss.
+
+        factory must return a (value, nbytes) tuple.
+        """
+        value = self.get(key)
+        if value is None:
+            value, nbytes = factory()
+            self.put(key, value, nbytes)
+        return value
+
+    def clear(self):
+        """
+        Drop all entries. Statistics are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Get the current size, limits and hit/miss/eviction counters.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self._bytes -= nbytes
+            self.evictions += 1
+
+
+diffusion_operator_cache = OperatorCache()
+casadi_solver_cache = OperatorCache(max_entries=16)
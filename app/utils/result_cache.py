@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _canonical(value):
+    """
+    Convert request parameters into a form that serializes identically for
+    equal inputs: numbers become floats (so 50 and 50.0 match), arrays and
+    tuples become lists and dict keys are sorted on serialization.
+    """
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (bool, np.bool_)) or value is None:
+        return None if value is None else bool(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    return value
+
+
+def result_key(namespace, params):
+    """
+    Build the cache key for a calculation from its canonicalized parameters.
+    """
+    payload = json.dumps([namespace, _canonical(params)], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    A cache of finished calculation results, keyed on their canonicalized inputs.
+
+    Results are kept in a per-process LRU bounded by entry count and size, and
+    expire after ttl seconds. When a directory is configured, results are also
+    written there so every worker process sharing the directory can reuse them;
+    the directory is pruned oldest-first once it exceeds disk_max_bytes.
+
+    Values are either bytes or JSON-serializable objects.
+    """
+    def __init__(self, max_entries=256, max_bytes=128 * 1024 * 1024, ttl=3600,
+                 directory=None, disk_max_bytes=1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # key -> (value, nbytes, expires)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def configure(self, max_entries=None, max_bytes=None, ttl=None, directory=None, disk_max_bytes=None):
+        """
+        Update the limits and evict entries that no longer fit. An empty
+        directory disables the disk tier.
+        """
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = int(max_entries)
+            if max_bytes is not None:
+                self.max_bytes = int(max_bytes)
+            if ttl is not None:
+                self.ttl = float(ttl)
+            if directory is not None:
+                self.directory = directory or None
+                if self.directory:
+                    os.makedirs(self.directory, exist_ok=True)
+            if disk_max_bytes is not None:
+                self.disk_max_bytes = int(disk_max_bytes)
+            self._evict()
+
+    def get(self, namespace, params):
+        """
+        Return the cached result for the calculation, or None on a miss.
+        """
+        key = result_key(namespace, params)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._drop(key)
+                self.expirations += 1
+
+        value = self._read_disk(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._store(key, value, now)
+        return value
+
+    def put(self, namespace, params, value):
+        """
+        Store the result of a calculation in memory and, if enabled, on disk.
+        """
+        key = result_key(namespace, params)
+        data = self._serialize(value)
+        now = time.time()
+        self._store(key, value, now, len(data))
+        if self.directory:
+            self._write_disk(key, data)
+
+    def clear(self):
+        """
+        Drop all entries, including the disk tier. Statistics are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        for path in self._disk_files():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        """
+        Get the current size, limits and hit/miss/eviction counters of this process.
+        """
+        with self._lock:
+            stats = {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "disk": None
+            }
+        if self.directory:
+            files = self._disk_files()
+            stats["disk"] = {
+                "directory": self.directory,
+                "entries": len(files),
+                "bytes": sum(self._file_size(path) for path in files),
+                "max_bytes": self.disk_max_bytes
+            }
+        return stats
+
+    def _store(self, key, value, now, nbytes=None):
+        if nbytes is None:
+            nbytes = len(self._serialize(value))
+        with self._lock:
+            if nbytes > self.max_bytes or self.max_entries <= 0:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, nbytes, now + self.ttl)
+            self._bytes += nbytes
+            self._evict()
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[1]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, nbytes, _) = self._entries.popitem(last=False)
+            self._bytes -= nbytes
+            self.evictions += 1
+
+    @staticmethod
+    def _serialize(value):
+        if isinstance(value, bytes):
+            return b'b' + value
+        return b'j' + json.dumps(value, separators=(',', ':')).encode()
+
+    @staticmethod
+    def _deserialize(data):
+        if data[:1] == b'b':
+            return data[1:]
+        return json.loads(data[1:])
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.result')
+
+    def _disk_files(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return [entry.path for entry in os.scandir(self.directory) if entry.name.endswith('.result')]
+
+    @staticmethod
+    def _file_size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _read_disk(self, key, now):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl <= now:
+                os.remove(path)
+                with self._lock:
+                    self.expirations += 1
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Reading refreshes the access time used for pruning
+            os.utime(path, (now, os.path.getmtime(path)))
+            return self._deserialize(data)
+        except (OSError, ValueError):
+            # Missing, removed by another worker or partially written
+            return None
+
+    def _write_disk(self, key, data):
+        try:
+            # Write to a temporary file first so other workers never read a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            self._prune_disk()
+        except OSError as e:
+            print(f"Failed to write result cache entry: {str(e)}")
+
+    def _prune_disk(self):
+        files = []
+        for path in self._disk_files():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_atime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+result_cache = ResultCache()
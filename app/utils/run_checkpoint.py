@@ -0,0 +1,339 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: runs are not locked against concurrent resumes
+    fcntl = None
+
+RUN_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class RunInProgressError(RuntimeError):
+    """Raised when a run is opened while another request is computing it."""
+
+
+def _write_file(path, data):
+    """
+    Replace the file at path with data, so readers see the old or the new content.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _lock_run(path):
+    """
+    Lock the run in directory path, returns the open lock file or None when
+    another process holds it.
+    """
+    lock = open(os.path.join(path, 'lock'), 'w')
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+    return lock
+
+
+def _run_size(path):
+    """Bytes taken by the files of a run, counting the frame file at its full size"""
+    size = 0
+    for entry in os.scandir(path):
+        try:
+            size += entry.stat().st_size
+        except OSError:
+            pass
+    return size
+
+
+class RunCheckpoint:
+    """
+    The checkpoint and frames of one 2D diffusion run in its own directory.
+
+    The directory holds the run parameters (params.json), the frames in a
+    memory-mapped array of shape (n_frames, nx, ny[, 3]) written as they are
+    produced (frames.npy), the number of steps and the time of every frame
+    (frames.json), the number of frames written so far (progress), and the
+    latest state (state.npz): the field u, the number of steps done and the
+    number of frames covered. The state is replaced atomically, so a worker
+    killed at any point leaves the previous checkpoint intact; frames written
+    after it are recomputed on restore.
+
+    While open, the run is locked against other processes.
+    """
+    def __init__(self, path, params, interval, lock=None):
+        self.path = path
+        self.params = params
+        self.interval = interval
+        self.frames = None
+        self._lock = lock
+        self._frame_count = 0
+        self._nt = 0
+        self._times = []
+
+    def restore(self, nt, times, frame_shape, dtype=np.uint8):
+        """
+        Open the frame file for a run of nt steps and len(times) frames, each
+        of frame_shape and dtype, and load the latest checkpoint.
+
+        Returns (step, u, frame_count) or None for a new run; the first
+        frame_count entries of self.frames are the frames emitted up to step.
+        """
+        self._nt, self._times = nt, list(times)
+        shape = (len(self._times),) + tuple(frame_shape)
+        frames_path = os.path.join(self.path, 'frames.npy')
+        try:
+            frames = np.load(frames_path, mmap_mode='r+')
+            if frames.shape != shape or frames.dtype != np.dtype(dtype):
+                raise ValueError("Frame file does not match the run")
+            state = np.load(os.path.join(self.path, 'state.npz'))
+        except (OSError, ValueError):
+            # New run; hide the frames from readers until the frame file is rebuilt
+            for name in ['frames.json', 'progress']:
+                if os.path.exists(os.path.join(self.path, name)):
+                    os.remove(os.path.join(self.path, name))
+            # The frame file is sparse, so only written frames take space
+            self.frames = np.lib.format.open_memmap(frames_path, mode='w+', dtype=dtype, shape=shape)
+            self._frame_count = 0
+            self._publish_layout()
+            return None
+
+        with state:
+            step, u, frame_count = int(state['step']), state['u'], int(state['frame_count'])
+        self.frames = frames
+        self._frame_count = frame_count
+        self._publish_layout()
+        return step, u, frame_count
+
+    def _publish_layout(self):
+        _write_file(os.path.join(self.path, 'frames.json'), json.dumps({"nt": self._nt, "times": self._times}))
+        self._publish_progress()
+
+    def _publish_progress(self):
+        _write_file(os.path.join(self.path, 'progress'), str(self._frame_count))
+
+    def append_frame(self, frame):
+        """
+        Write the next emitted frame. Readers see it right away; it becomes
+        part of the checkpoint at the next save.
+        """
+        self.frames[self._frame_count] = frame
+        self._frame_count += 1
+        # The memory map shares its pages with readers, so publish the count after the frame
+        self._publish_progress()
+
+    def save(self, step, u):
+        """
+        Checkpoint the field u after step steps, with the frames written so far.
+        """
+        if self.frames is not None:
+            self.frames.flush()
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, step=step, u=u, frame_count=self._frame_count)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(self.path, 'state.npz'))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def close(self):
+        """
+        Flush the frame file and release the run lock. self.frames stays
+        readable until it is dropped.
+        """
+        if self.frames is not None:
+            self.frames.flush()
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+
+class RunCheckpointStore:
+    """
+    Checkpoints and frames of long-running 2D diffusion runs on local disk.
+
+    Every run is identified by its owner and a client chosen run_id, so a
+    request killed by a worker timeout or restart can be repeated with the
+    same run_id and continue from the last checkpoint, and the frames of the
+    run can be read back by index while it is computed and after. Runs are
+    checkpointed every interval steps and when they finish; an interval of 0
+    only saves finished runs. Runs not touched for ttl seconds are removed,
+    and every owner keeps at most max_runs runs, the least recently opened
+    ones being removed first.
+    """
+    def __init__(self, directory=None, interval=0, ttl=24 * 3600, max_runs=3):
+        self.directory = directory
+        self.interval = interval
+        self.ttl = ttl
+        self.max_runs = max_runs
+
+    def configure(self, directory=None, interval=None, ttl=None, max_runs=None):
+        """
+        Update the checkpoint directory, interval, time to live and runs per owner.
+        """
+        if directory is not None:
+            self.directory = directory or None
+        if interval is not None:
+            self.interval = int(interval)
+        if ttl is not None:
+            self.ttl = float(ttl)
+        if max_runs is not None:
+            self.max_runs = int(max_runs)
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def open(self, owner, run_id, params, size=0, quota=None):
+        """
+        Open the checkpoint of a run, creating it if it does not exist.
+
+        size is the number of bytes the run will take. Other runs of the owner
+        are removed, least recently opened first, to keep at most max_runs
+        runs and their bytes plus size within quota, if given.
+
+        Raises ValueError for an invalid run_id, when the run exists with
+        other parameters or does not fit in quota, and RunInProgressError
+        when another request holds it.
+        """
+        if not RUN_ID_PATTERN.match(str(run_id)):
+            raise ValueError("run_id must be 1 to 64 letters, digits, '-' or '_'")
+        if quota is not None and size > quota:
+            raise ValueError("Storage limit exceeded")
+        self.prune()
+        path = os.path.join(self.directory, str(owner), run_id)
+        os.makedirs(path, exist_ok=True)
+
+        lock = _lock_run(path)
+        if lock is None:
+            raise RunInProgressError(f"Run {run_id} is already being computed")
+
+        params_path = os.path.join(path, 'params.json')
+        try:
+            with open(params_path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            stored = None
+        if stored is None:
+            with open(params_path, 'w') as f:
+                json.dump(params, f)
+            # A run without parameters has no usable state
+            for name in ['state.npz', 'frames.npy', 'frames.json', 'progress']:
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+        elif stored != json.loads(json.dumps(params)):
+            lock.close()
+            raise ValueError(f"Run {run_id} was started with different parameters")
+        os.utime(path)
+
+        used = self._make_room(os.path.join(self.directory, str(owner)), run_id, size, quota)
+        if quota is not None and used + size > quota:
+            # The other runs are still being computed
+            if stored is None:
+                shutil.rmtree(path, ignore_errors=True)
+            lock.close()
+            raise ValueError("Storage limit exceeded")
+        return RunCheckpoint(path, params, self.interval, lock)
+
+    def _make_room(self, owner_path, run_id, size, quota):
+        """
+        Remove the least recently opened runs in owner_path other than run_id
+        that are not being computed until at most max_runs runs are left and,
+        if quota is given, the rest fits with size bytes. Returns the bytes
+        taken by the remaining other runs.
+        """
+        runs = []
+        for run in os.scandir(owner_path):
+            try:
+                if run.is_dir() and run.name != run_id:
+                    runs.append((run.stat().st_mtime, run.path, _run_size(run.path)))
+            except OSError:
+                pass
+        runs.sort()
+        used = sum(run_size for _, _, run_size in runs)
+        count = len(runs) + 1
+        for _, run_path, run_size in runs:
+            if count <= self.max_runs and (quota is None or used + size <= quota):
+                break
+            lock = _lock_run(run_path)
+            if lock is None:
+                continue
+            with lock:
+                shutil.rmtree(run_path, ignore_errors=True)
+            used -= run_size
+            count -= 1
+        return used
+
+    def read_frames(self, owner, run_id):
+        """
+        Open the frames of a run for reading, returns (frames, state, params)
+        or None if the run has not started. frames is a read-only memory map
+        of all frames of the run, of which the first state['frame_count']
+        have been computed; state also holds 'nt', the number of steps, and
+        'times', the time of every frame.
+        """
+        if not self.directory or not RUN_ID_PATTERN.match(str(run_id)):
+            return None
+        path = os.path.join(self.directory, str(owner), run_id)
+        try:
+            with open(os.path.join(path, 'frames.json')) as f:
+                state = json.load(f)
+            # Read the count before mapping the frames, which are written before it
+            with open(os.path.join(path, 'progress')) as f:
+                state["frame_count"] = int(f.read())
+            with open(os.path.join(path, 'params.json')) as f:
+                params = json.load(f)
+            frames = np.load(os.path.join(path, 'frames.npy'), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        return frames, state, params
+
+    def delete(self, owner, run_id):
+        """
+        Remove the checkpoint of a run, if any.
+        """
+        if self.directory and RUN_ID_PATTERN.match(str(run_id)):
+            shutil.rmtree(os.path.join(self.directory, str(owner), run_id), ignore_errors=True)
+
+    def prune(self):
+        """
+        Remove runs that have not been opened for ttl seconds.
+        """
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        expired = time.time() - self.ttl
+        for owner in os.scandir(self.directory):
+            if not owner.is_dir():
+                continue
+            for run in os.scandir(owner.path):
+                try:
+                    if not run.is_dir() or run.stat().st_mtime >= expired:
+                        continue
+                    lock = _lock_run(run.path)
+                except OSError:
+                    continue
+                # Runs still being computed are kept
+                if lock is not None:
+                    with lock:
+                        shutil.rmtree(run.path, ignore_errors=True)
+
+
+run_checkpoints = RunCheckpointStore()
@@ -2,29 +2,85 @@ import numpy as np
 import matplotlib.pyplot as plt
 import casadi as ca
 import os
+import atexit
+import threading
+from scipy import sparse
+from scipy.linalg import solve_banded
+from scipy.sparse.linalg import splu
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.operator_cache import diffusion_operator_cache, casadi_solver_cache
+from app.utils.colormap import Colorizer, Quantizer
 
 def calculate_temperature_influence(x0, Ea=50000, T=313):
     T_ref = 293
     R = 8.41
-    x = x0 * np.exp(Ea * (1 / T_ref - 1 / T) / R)
+    # Works element-wise for arrays of temperatures as well
+    x = x0 * np.exp(Ea * (1 / T_ref - 1 / np.asarray(T, dtype=float)) / R)
     return x
 
-def diffusion_solver(d, r, ns):
+F = 96485 # Faraday's constant
+Sa = 3E5
+
+def radial_mesh(r, ns, mesh='uniform', grading=10):
     """
-    Traditional solver using numpy
+    Node positions of the radial grid, from the centre (0) to the surface (r)
     
     Args:
-        d (float): Diffusion coefficient
         r (float): Radius
         ns (int): Number of spatial discretization points
+        mesh (str): 'uniform', or 'geometric' for spacings shrinking
+            geometrically towards the surface
+        grading (float): Ratio of the centre spacing to the surface spacing
+            of a geometric mesh
+    """
+    if mesh == 'uniform':
+        return np.linspace(0, r, ns + 1)
+    if mesh != 'geometric':
+        raise ValueError(f"Unknown mesh {mesh}")
+    if grading <= 0:
+        raise ValueError("grading must be positive")
+    
+    ratio = grading**(-1 / (ns - 1)) if ns > 1 else 1.0
+    spacing = ratio**np.arange(ns)
+    nodes = np.concatenate(([0.0], np.cumsum(spacing*r / spacing.sum())))
+    nodes[-1] = r
+    return nodes
+
+def _diffusion_coefficients(d, r, ns, dt=1, normalize=True, mesh='uniform', grading=10):
     """
-    F = 96485 # Faraday's constant
-    Sa = 3E5
+    Normalized control-volume coefficients of the spherical diffusion problem
+    
+    The radial index runs along the first axis. Passing arrays of shape (B,)
+    for `d` and `r` gives coefficients of shape (ns, B), one column per system.
+    
+    On a non-uniform mesh (scalar d and r only) the faces sit halfway between
+    nodes and each face conductance uses the local node spacing.
+    
+    Args:
+        d (float or ndarray): Diffusion coefficient
+        r (float or ndarray): Radius
+        ns (int): Number of spatial discretization points
+        dt (float): Time step
+        normalize (bool): Return the raw (a_tk, a_wk, a_ek, a_tn, a_wn) when False
+        mesh (str): Mesh type, see `radial_mesh`
+        grading (float): Grading of a geometric mesh
+    """
+    if mesh != 'uniform':
+        nodes = radial_mesh(r, ns, mesh, grading)
+        faces = np.concatenate(([0.0], (nodes[:-1] + nodes[1:]) / 2))
+        conductance = np.power(faces[1:], 2)*d / np.diff(nodes)
+        
+        a_tk = (np.power(faces[1:], 3) - np.power(faces[:-1], 3))/3 / dt
+        a_wk = np.concatenate(([0.0], conductance[:-1]))
+        a_ek = conductance
+        a_tn = (r**3 - faces[-1]**3)/3 / dt
+        a_wn = conductance[-1]
+        
+        if not normalize:
+            return a_tk, a_wk, a_ek, a_tn, a_wn
+        return _normalize_coefficients(a_tk, a_wk, a_ek, a_tn, a_wn, r)
     
-    rp_loc_disc = np.linspace(0, r, (2*ns + 1) + 1)
-    rp_disc = np.linspace(0, r, ns + 1)
     delta_rp = r / (2*ns + 1)
-    dt = 1
     
     r_kplus = np.linspace(delta_rp*2, r - delta_rp, ns)
     r_kminus = np.linspace(0, r - delta_rp, ns + 1)
@@ -36,127 +92,659 @@ def diffusion_solver(d, r, ns):
     a_wk = np.power(r_kminus[:-1], 2)*d / (2*delta_rp)
     a_ek = np.power(r_kplus, 2)*d / (2*delta_rp)
     
-    # Normalized coefficients
-    a_tk_bar = a_tk / (a_wk + a_ek + a_tk)
-    a_wk_bar = a_wk / (a_wk + a_ek + a_tk)
-    a_ek_bar = a_ek / (a_wk + a_ek + a_tk)
-    
     # Boundary conditions
     delta_Vn = (r**3 - (r - delta_rp)**3)/3
     a_tn = delta_Vn / dt
     a_wn = (r - delta_rp)**2 * d / (2*delta_rp)
-    a_tn_bar = a_tn / (a_tn + a_wn)
-    a_wn_bar = a_wn / (a_tn + a_wn)
-    m = r**2 / ((a_tn + a_wn)*Sa*F)
+    
+    if not normalize:
+        return a_tk, a_wk, a_ek, a_tn, a_wn
+    return _normalize_coefficients(a_tk, a_wk, a_ek, a_tn, a_wn, r)
+
+def _diffusion_coefficients_symbolic(D, R, Ns, dt=1):
+    """
+    Normalized coefficients as CasADi expressions of symbolic D and R
+    
+    Volumes scale with R**3 and face conductances with R*D, so the geometry
+    is evaluated once on the unit sphere and scaled symbolically.
+    """
+    unit = _diffusion_coefficients(1.0, 1.0, Ns, dt, normalize=False)
+    a_tk, a_wk, a_ek, a_tn, a_wn = (ca.DM(np.asarray(v)) for v in unit)
+    return _normalize_coefficients(R**3*a_tk, R*D*a_wk, R*D*a_ek, R**3*a_tn, R*D*a_wn, R)
+
+def _normalize_coefficients(a_tk, a_wk, a_ek, a_tn, a_wn, r):
+    return {
+        'a_tk_bar': a_tk / (a_wk + a_ek + a_tk),
+        'a_wk_bar': a_wk / (a_wk + a_ek + a_tk),
+        'a_ek_bar': a_ek / (a_wk + a_ek + a_tk),
+        'a_tn_bar': a_tn / (a_tn + a_wn),
+        'a_wn_bar': a_wn / (a_tn + a_wn),
+        'm': r**2 / ((a_tn + a_wn)*Sa*F),
+    }
+
+def _diffusion_residual(cs_iter, cs, coeffs, j, concat=np.concatenate):
+    """
+    Residual of the discretized equations, assembled with whole-array slices
+    
+    The centre, interior and surface rows are built as three slices and
+    joined with `concat`, so the same code serves NumPy arrays and CasADi
+    symbols (pass `lambda parts: ca.vertcat(*parts)` for the latter).
+    
+    Args:
+        cs_iter: Concentration at the new time level
+        cs: Concentration at the previous time level
+        coeffs (dict): Output of `_diffusion_coefficients`
+        j (float): Surface flux
+        concat (callable): Joins the list of row blocks into one vector
+    """
+    a_tk_bar = coeffs['a_tk_bar']
+    a_wk_bar = coeffs['a_wk_bar']
+    a_ek_bar = coeffs['a_ek_bar']
+    
+    centre = cs_iter[0:1] - a_ek_bar[0:1]*cs_iter[1:2] - a_tk_bar[0:1]*cs[0:1]
+    interior = -a_wk_bar[1:]*cs_iter[:-2] + cs_iter[1:-1] - a_ek_bar[1:]*cs_iter[2:] - a_tk_bar[1:]*cs[1:-1]
+    surface = -coeffs['a_wn_bar']*cs_iter[-2:-1] + cs_iter[-1:] - coeffs['a_tn_bar']*cs[-1:] + coeffs['m']*j
+    return concat([centre, interior, surface])
+
+def _diffusion_jacobian_banded(coeffs):
+    """
+    Tridiagonal Jacobian of `_diffusion_residual` in banded storage
+    
+    Row 0 holds the upper diagonal, row 1 the main diagonal and row 2 the
+    lower diagonal, as expected by `scipy.linalg.solve_banded`. Batched
+    coefficients give a (3, ns + 1, B) array.
+    """
+    a_ek_bar = coeffs['a_ek_bar']
+    ns = a_ek_bar.shape[0]
+    
+    jacob_p = np.zeros((3, ns + 1) + a_ek_bar.shape[1:])
+    jacob_p[0, 1:] = -a_ek_bar
+    jacob_p[1] = 1
+    jacob_p[2, :ns - 1] = -coeffs['a_wk_bar'][1:]
+    jacob_p[2, ns - 1] = -coeffs['a_wn_bar']
+    return jacob_p
+
+def _diffusion_operator(d, r, ns, dt=1, mesh='uniform', grading=10, cache=True):
+    """
+    Coefficients and LU-factorized Jacobian for one geometry
+    
+    Both depend only on (d, r, ns, dt) and the mesh, so they are kept in
+    `diffusion_operator_cache` and a repeated geometry costs only a
+    back-substitution. With cache=False a one-off operator is built without
+    displacing cached ones.
+    """
+    def build():
+        coeffs = _diffusion_coefficients(d, r, ns, dt, mesh=mesh, grading=grading)
+        jacob_p = _diffusion_jacobian_banded(coeffs)
+        jacob_csc = sparse.diags([jacob_p[2, :-1], jacob_p[1], jacob_p[0, 1:]], [-1, 0, 1], format='csc')
+        factor = splu(jacob_csc, permc_spec='NATURAL')
+        # No fill-in for a tridiagonal matrix: L and U hold 2*(ns+1) values each
+        nbytes = sum(np.asarray(v).nbytes for v in coeffs.values()) + 4*(ns + 1)*12
+        return {'coeffs': coeffs, 'factor': factor}, nbytes
+    
+    if not cache:
+        return build()[0]
+    key = (float(d), float(r), int(ns), float(dt))
+    if mesh != 'uniform':
+        key += (mesh, float(grading))
+    return diffusion_operator_cache.get_or_create(key, build)
+
+def diffusion_solver(d, r, ns, mesh='uniform', grading=10):
+    """
+    Traditional solver using numpy
+    
+    The Jacobian is tridiagonal and depends only on the geometry, so its
+    sparse LU factorization is cached and each Newton step is an O(ns)
+    back-substitution instead of a dense inverse.
+    
+    Args:
+        d (float): Diffusion coefficient
+        r (float): Radius
+        ns (int): Number of spatial discretization points
+        mesh (str): 'uniform', or 'geometric' to refine towards the surface
+        grading (float): Ratio of centre to surface spacing of a geometric mesh
+    """
+    rp_disc = radial_mesh(r, ns, mesh, grading)
+    operator = _diffusion_operator(d, r, ns, mesh=mesh, grading=grading)
+    coeffs = operator['coeffs']
     
     # Initial conditions
     cs = np.ones(ns + 1)*10000
     cs_iter = cs.copy()
     j = -Sa*6
-    Spn_newton = 1
     
     iteration = 1000
     tolerance = 1e-10
+    loss_previous = np.inf
     
     for n in range(iteration):
-        f_p = np.zeros(ns + 1)
-        jacob_p = np.zeros((ns + 1, ns + 1))
+        f_p = _diffusion_residual(cs_iter, cs, coeffs, j)
         
-        for i in range(ns + 1):
-            if i == 0:
-                jacob_p[i, i] = 1
-                jacob_p[i, i+1] = -a_ek_bar[i]
-                f_p[i] = cs_iter[i] - a_ek_bar[i]*cs_iter[i + 1] - a_tk_bar[i]*cs[i]
-            elif i == ns:
-                jacob_p[i, i - 1] = -a_wn_bar
-                jacob_p[i, i] = Spn_newton
-                f_p[i] = -a_wn_bar*cs_iter[i-1] + cs_iter[i] - a_tn_bar*cs[i] + m*j
-            else:
-                jacob_p[i, i - 1] = -a_wk_bar[i]
-                jacob_p[i, i] = 1
-                jacob_p[i, i + 1] = -a_ek_bar[i]
-                f_p[i] = -a_wk_bar[i]*cs_iter[i - 1] + cs_iter[i] - a_ek_bar[i]*cs_iter[i + 1] - a_tk_bar[i]*cs[i]
+        loss_value = np.linalg.norm(f_p, ord=2)
+        # The residual cannot drop below round-off, stop once it stagnates
+        if loss_value >= loss_previous:
+            break
+        loss_previous = loss_value
         
-        jacob_p_inv = np.linalg.inv(jacob_p)
-        cs_iter_update = cs_iter - jacob_p_inv @ f_p
-        cs_iter = cs_iter_update
+        cs_iter = cs_iter - operator['factor'].solve(f_p)
         
-        loss_value = np.linalg.norm(f_p, ord=2)
         if loss_value < tolerance:
             break
     
     return rp_disc, cs_iter, loss_value
 
-def diffusion_solver_casadi(D, R, Ns):
+def diffusion_solver_refined(d, r, tolerance, mesh='geometric', grading=10, ns_start=8, ns_max=4096):
     """
-    CasADi solver for the diffusion problem
+    Solve on successively doubled grids until the surface concentration converges
     
     Args:
-        D (float): Diffusion coefficient
-        R (float): Radius
-        Ns (int): Number of spatial discretization points
+        d (float): Diffusion coefficient
+        r (float): Radius
+        tolerance (float): Target change of the surface concentration between
+            two successive grids, relative to the span of the profile
+        mesh (str): Mesh type, see `radial_mesh`
+        grading (float): Grading of a geometric mesh
+        ns_start (int): Coarsest grid
+        ns_max (int): Finest grid allowed
+    
+    Returns:
+        rp_disc, cs_iter, loss_value of the finest grid solved and the
+        estimated relative surface error (inf if only one grid was solved)
     """
-    F = 96485
-    Sa = 3E5
+    ns = max(1, min(ns_start, ns_max))
+    rp_disc, cs_iter, loss_value = diffusion_solver(d, r, ns, mesh, grading)
+    surface_error = np.inf
+    
+    while 2*ns <= ns_max:
+        ns *= 2
+        surface_previous = cs_iter[-1]
+        rp_disc, cs_iter, loss_value = diffusion_solver(d, r, ns, mesh, grading)
+        # The surface concentration is large next to its variation over the
+        # particle, so relate the change to the span of the profile
+        span = np.ptp(cs_iter) or abs(cs_iter[-1])
+        surface_error = abs(cs_iter[-1] - surface_previous) / span
+        if surface_error < tolerance:
+            break
     
-    delta_rp = R / (2*Ns + 1)
-    dt = 1
+    return rp_disc, cs_iter, loss_value, surface_error
+
+def diffusion_solver_batch(d, r, ns):
+    """
+    Solve many independent diffusion problems sharing one grid size
     
-    r_kplus = np.linspace(delta_rp*2, R - delta_rp, Ns)
-    r_kminus = np.linspace(0, R - delta_rp, Ns + 1)
+    The B tridiagonal systems are stacked into a single block-diagonal banded
+    matrix (the couplings between blocks are zero), so one banded solve
+    handles the whole batch.
     
-    # Create CasADi variables
-    cs = ca.MX.sym('cs', Ns + 1)
+    Args:
+        d (array_like): Diffusion coefficients, shape (B,)
+        r (array_like): Radii, shape (B,)
+        ns (int): Number of spatial discretization points
     
-    delta_Vk = (ca.power(r_kplus, 3) - ca.power(r_kminus[:-1], 3))/3
+    Returns:
+        rp_disc (B, ns + 1), cs_iter (B, ns + 1) and loss_value (B,)
+    """
+    d, r = np.broadcast_arrays(np.asarray(d, dtype=float), np.asarray(r, dtype=float))
+    batch_size = d.shape[0]
     
-    a_tk = delta_Vk / dt
-    a_wk = ca.power(r_kminus[:-1], 2)*D / (2*delta_rp)
-    a_ek = ca.power(r_kplus, 2)*D / (2*delta_rp)
+    rp_disc = np.linspace(0, r, ns + 1, axis=-1)
+    coeffs = _diffusion_coefficients(d, r, ns)
     
-    a_tk_bar = a_tk / (a_wk + a_ek + a_tk)
-    a_wk_bar = a_wk / (a_wk + a_ek + a_tk)
-    a_ek_bar = a_ek / (a_wk + a_ek + a_tk)
+    # Initial conditions, one column per system
+    cs = np.ones((ns + 1, batch_size))*10000
+    cs_iter = cs.copy()
+    j = -Sa*6
     
-    # Boundary conditions
-    delta_Vn = (R**3 - (R - delta_rp)**3)/3
-    a_tn = delta_Vn / dt
-    a_wn = (R - delta_rp)**2 * D / (2*delta_rp)
-    a_tn_bar = a_tn / (a_tn + a_wn)
-    a_wn_bar = a_wn / (a_tn + a_wn)
-    M = R**2 / ((a_tn + a_wn)*Sa*F)
+    # (3, ns + 1, B) -> (3, B*(ns + 1)) with each system in a contiguous block
+    jacob_p = _diffusion_jacobian_banded(coeffs).transpose(0, 2, 1).reshape(3, -1)
+    
+    iteration = 1000
+    tolerance = 1e-10
+    loss_previous = np.inf
+    
+    for n in range(iteration):
+        f_p = _diffusion_residual(cs_iter, cs, coeffs, j)
+        
+        loss_value = np.linalg.norm(f_p, ord=2, axis=0)
+        # The residual cannot drop below round-off, stop once it stagnates
+        if np.max(loss_value) >= loss_previous:
+            break
+        loss_previous = np.max(loss_value)
+        
+        delta = solve_banded((1, 1), jacob_p, f_p.T.ravel(), check_finite=False)
+        cs_iter = cs_iter - delta.reshape(batch_size, ns + 1).T
+        
+        if np.all(loss_value < tolerance):
+            break
+    
+    return rp_disc, cs_iter.T, loss_value
+
+def concentration_diffusivity(d, spec):
+    """
+    Build D(c) and dD/dc from a diffusivity specification
+    
+    Args:
+        d (float): Reference diffusion coefficient
+        spec (dict): Either {'type': 'table', 'c': [...], 'd': [...]} with D
+            interpolated linearly in c (and held constant outside the table),
+            or {'type': 'arrhenius', 'alpha': ..., 'c_ref': ...} for the
+            Arrhenius-style D(c) = d * exp(alpha * (c / c_ref - 1))
+    
+    Returns:
+        (diffusivity, derivative) callables acting on concentration arrays
+    """
+    kind = spec.get('type')
+    if kind == 'table':
+        c_table = np.asarray(spec['c'], dtype=float)
+        d_table = np.asarray(spec['d'], dtype=float)
+        if c_table.ndim != 1 or c_table.shape != d_table.shape or len(c_table) < 2:
+            raise ValueError("Diffusivity table needs matching 'c' and 'd' lists with at least 2 points")
+        order = np.argsort(c_table)
+        c_table, d_table = c_table[order], d_table[order]
+        slopes = np.diff(d_table) / np.diff(c_table)
+        
+        def diffusivity(c):
+            return np.interp(c, c_table, d_table)
+        
+        def derivative(c):
+            segment = np.clip(np.searchsorted(c_table, c) - 1, 0, len(slopes) - 1)
+            inside = (c >= c_table[0]) & (c <= c_table[-1])
+            return np.where(inside, slopes[segment], 0.0)
+    elif kind == 'arrhenius':
+        alpha = float(spec['alpha'])
+        c_ref = float(spec['c_ref'])
+        
+        def diffusivity(c):
+            return d*np.exp(alpha*(c/c_ref - 1))
+        
+        def derivative(c):
+            return diffusivity(c)*alpha/c_ref
+    else:
+        raise ValueError(f"Unknown diffusivity type {kind}")
+    return diffusivity, derivative
+
+def diffusion_solver_nonlinear(d, r, ns, diffusivity, dt=1, iteration=100, tolerance=1e-10):
+    """
+    Solver for a concentration-dependent diffusion coefficient D(c)
+    
+    Face diffusivities are evaluated at the mean of the two neighbouring
+    nodes. The tridiagonal Jacobian is factorized sparsely and reused across
+    iterations (modified Newton); it is only refreshed when the residual
+    stops dropping fast enough, and every step is damped by a backtracking
+    line search on the residual norm.
+    
+    Args:
+        d (float): Reference diffusion coefficient, also used to scale the residual
+        r (float): Radius
+        ns (int): Number of spatial discretization points
+        diffusivity (dict): Specification passed to `concentration_diffusivity`
+        dt (float): Time step
+        iteration (int): Maximum number of iterations
+        tolerance (float): Tolerance on the scaled residual norm
+    """
+    diffusivity, derivative = concentration_diffusivity(d, diffusivity)
+    
+    rp_disc = np.linspace(0, r, ns + 1)
+    a_tk, a_wk, a_ek, a_tn, a_wn = _diffusion_coefficients(1.0, r, ns, dt, normalize=False)
+    # Geometric conductance of faces 1..ns, face f lies between nodes f-1 and f
+    g = a_ek
+    a_t = np.append(a_tk, a_tn)
+    # Rows are scaled like the constant-d normalized equations
+    scale = 1 / np.append(a_tk + d*(a_wk + a_ek), a_tn + d*a_wn)
+    surface = r**2 / (Sa*F)
     
-    eq = []
+    cs = np.ones(ns + 1)*10000
+    cs_iter = cs.copy()
     j = -Sa*6
-    cs_init = np.ones(Ns + 1)*10000
     
-    for i in range(Ns + 1):
-        if i == 0:
-            eq.append(cs[i] - a_ek_bar[i]*cs[i + 1] - a_tk_bar[i]*cs_init[i])
-        elif i == Ns:
-            eq.append(-a_wn_bar*cs[i-1] + cs[i] - a_tn_bar*cs_init[i] + M*j)
-        else:
-            eq.append(-a_wk_bar[i]*cs[i - 1] + cs[i] - a_ek_bar[i]*cs[i + 1] - a_tk_bar[i]*cs_init[i])
+    def residual(c):
+        flux = g*diffusivity((c[:-1] + c[1:]) / 2)*(c[1:] - c[:-1])
+        f_p = a_t*(c - cs)
+        f_p[:-1] -= flux
+        f_p[1:] += flux
+        f_p[-1] += surface*j
+        return scale*f_p
+    
+    def factorize(c):
+        c_face = (c[:-1] + c[1:]) / 2
+        conductance = g*diffusivity(c_face)
+        dflux = g*derivative(c_face)*(c[1:] - c[:-1]) / 2
+        # d flux_f / d c_f and d flux_f / d c_{f-1}
+        d_right = conductance + dflux
+        d_left = -conductance + dflux
+        main = a_t.copy()
+        main[:-1] -= d_left
+        main[1:] += d_right
+        jacob_p = sparse.diags(
+            [scale[1:]*d_left, scale*main, -scale[:-1]*d_right], [-1, 0, 1], format='csc'
+        )
+        return splu(jacob_p, permc_spec='NATURAL')
+    
+    f_p = residual(cs_iter)
+    loss_value = np.linalg.norm(f_p, ord=2)
+    factor = factorize(cs_iter)
+    # Whether the factorization was taken at the current iterate
+    fresh = True
     
-    # Create the nonlinear problem
-    eq = ca.vertcat(*eq)
-    nlp = {'x': cs, 'f': ca.dot(eq, eq)}
+    for n in range(iteration):
+        if loss_value < tolerance:
+            break
+        
+        delta = factor.solve(f_p)
+        # Backtracking line search on the residual norm
+        step = 1.0
+        while True:
+            candidate = cs_iter - step*delta
+            f_candidate = residual(candidate)
+            loss_candidate = np.linalg.norm(f_candidate, ord=2)
+            if loss_candidate < (1 - 1e-4*step)*loss_value or step < 1 / 64:
+                break
+            step /= 2
+        
+        if loss_candidate >= loss_value:
+            # No progress even with a fresh Jacobian means round-off is reached
+            if fresh:
+                break
+            factor = factorize(cs_iter)
+            fresh = True
+            continue
+        
+        slow = loss_candidate > 0.5*loss_value
+        cs_iter, f_p, loss_value = candidate, f_candidate, loss_candidate
+        # Keep the frozen Jacobian while it still converges quickly
+        if slow:
+            factor = factorize(cs_iter)
+        fresh = slow
     
-    # Create solver
-    opts = {'ipopt.print_level': 0, 'print_time': 0}
-    solver = ca.nlpsol('solver', 'ipopt', nlp, opts)
+    return rp_disc, cs_iter, loss_value
 
-    sol = solver(x0=cs_init)
-    cs_sol = sol['x'].full().flatten()
-    residual = np.sqrt(sol['f'].full()[0])
+def diffusion_solver_temperature_sweep(d, r, ns, T, Ea=50000):
+    """
+    Solve the diffusion problem for a vector of temperatures in one batch
     
+    Args:
+        d (float): Diffusion coefficient at the reference temperature
+        r (float): Radius
+        ns (int): Number of spatial discretization points
+        T (array_like): Temperatures in K
+        Ea (float): Activation energy
+    
+    Returns:
+        d_T (len(T),), rp_disc (ns + 1,), cs_iter (len(T), ns + 1) and loss_value (len(T),)
+    """
+    d_T = np.atleast_1d(calculate_temperature_influence(d, Ea, T))
+    rp_disc, cs_iter, loss_value = diffusion_solver_batch(d_T, r, ns)
+    return d_T, rp_disc[0], cs_iter, loss_value
+
+def diffusion_solver_transient(d, r, ns, t_end, dt=1, output_every=1, adaptive=False, tolerance=1e-3, dt_max=None):
+    """
+    Transient implicit solver, yields concentration profiles while marching in time
+    
+    The problem is linear, so every implicit step is a single back-substitution
+    with the cached factorization for the current time step. With `adaptive`
+    the step is doubled or halved on a power-of-two ladder, so only a handful
+    of factorizations are ever built.
+    
+    Args:
+        d (float): Diffusion coefficient
+        r (float): Radius
+        ns (int): Number of spatial discretization points
+        t_end (float): End time
+        dt (float): (Initial) time step
+        output_every (int): Yield every n-th step, the last step is always yielded
+        adaptive (bool): Adapt the time step to the relative profile change
+        tolerance (float): Target relative change per step when adaptive
+        dt_max (float): Upper bound for the adaptive time step
+    
+    Yields:
+        (step, t, cs_iter) for the initial profile and every output step;
+        the radial grid is np.linspace(0, r, ns + 1)
+    """
+    cs = np.ones(ns + 1)*10000
+    zeros = np.zeros(ns + 1)
+    j = -Sa*6
+    
+    # Time step is dt * 2**level; halving is bounded to avoid stalling
+    level = 0
+    min_level = -10
+    step = 0
+    t = 0.0
+    
+    yield step, t, cs
+    
+    while t < t_end*(1 - 1e-12):
+        step_dt = min(dt*2.0**level, t_end - t)
+        # The last step is cut to end at t_end; its operator is not reused
+        operator = _diffusion_operator(d, r, ns, step_dt, cache=step_dt == dt*2.0**level)
+        # Residual at zero is minus the right-hand side of the implicit step
+        cs_new = operator['factor'].solve(-_diffusion_residual(zeros, cs, operator['coeffs'], j))
+        
+        if adaptive:
+            change = np.max(np.abs(cs_new - cs)) / np.max(np.abs(cs))
+            if change > tolerance and level > min_level:
+                level -= 1
+                continue
+            if change < tolerance / 4 and (dt_max is None or dt*2.0**(level + 1) <= dt_max):
+                level += 1
+        
+        cs = cs_new
+        t += step_dt
+        step += 1
+        
+        if step % output_every == 0 or t >= t_end*(1 - 1e-12):
+            yield step, t, cs
+
+def _casadi_diffusion_solver(Ns, method='ipopt'):
+    """
+    Build (or fetch) the CasADi solver for one grid size
+    
+    D and R are symbolic parameters, so the graph and the solver are built
+    once per (Ns, method) and reused for every geometry.
+    """
+    def build():
+        cs = ca.MX.sym('cs', Ns + 1)
+        p = ca.MX.sym('p', 2)
+        coeffs = _diffusion_coefficients_symbolic(p[0], p[1], Ns)
+        
+        j = -Sa*6
+        cs_init = ca.DM(np.ones(Ns + 1)*10000)
+        eq = _diffusion_residual(cs, cs_init, coeffs, j, concat=lambda parts: ca.vertcat(*parts))
+        
+        if method == 'newton':
+            # The equations are square, solve them directly as a root-finding problem
+            opts = {'abstol': 1e-10, 'max_iter': 50, 'error_on_fail': False}
+            solver = ca.rootfinder('solver', 'newton', {'x': cs, 'p': p, 'g': eq}, opts)
+        elif method == 'ipopt':
+            # Least-squares formulation
+            opts = {'ipopt.print_level': 0, 'print_time': 0}
+            solver = ca.nlpsol('solver', 'ipopt', {'x': cs, 'p': p, 'f': ca.dot(eq, eq)}, opts)
+        else:
+            raise ValueError(f"Unknown CasADi method {method}")
+        residual = ca.Function('residual', [cs, p], [ca.norm_2(eq)])
+        return {'solver': solver, 'residual': residual, 'lock': threading.Lock()}, 0
+    
+    return casadi_solver_cache.get_or_create((int(Ns), method), build)
+
+def diffusion_solver_casadi(D, R, Ns, method='ipopt'):
+    """
+    CasADi solver for the diffusion problem
+    
+    Args:
+        D (float): Diffusion coefficient
+        R (float): Radius
+        Ns (int): Number of spatial discretization points
+        method (str): 'ipopt' (least squares) or 'newton' (rootfinder)
+    """
+    compiled = _casadi_diffusion_solver(Ns, method)
+    cs_init = np.ones(Ns + 1)*10000
+    p = [float(D), float(R)]
+    
+    with compiled['lock']:
+        if method == 'newton':
+            cs_sol = compiled['solver'](cs_init, p)
+        else:
+            cs_sol = compiled['solver'](x0=cs_init, p=p)['x']
+        residual = float(compiled['residual'](cs_sol, p))
+    
+    cs_sol = cs_sol.full().flatten()
     rp_disc = np.linspace(0, R, Ns + 1)
     return rp_disc, cs_sol, residual
 
+# Frame formats of the 2D solver: the trailing shape and dtype of a frame.
+# 'rgb' frames are colorized on the server; 'uint8' frames hold the colormap
+# bin of every cell (see app.utils.colormap.Quantizer) and 'float16' frames
+# the field itself, for clients that colorize frames themselves.
+FRAME_FORMATS = {
+    'rgb': ((3,), np.uint8),
+    'uint8': ((), np.uint8),
+    'float16': ((), np.float16)
+}
+
+
+def _step_function_field(nx, ny):
+    """
+    Initial field for the 2D solvers: -1 in the lower half, 1 in the upper half.
+    """
+    u = np.empty((nx, ny))
+    u[:, :ny // 2] = -1  # lower part
+    u[:, ny // 2:] = 1  # upper part
+    return u
+
+
+def _diffusion_2d_step(u, u_new, coef, dx, dy):
+    """
+    One explicit 5-point diffusion step from u into u_new, clipped to [-1, 1].
+
+    Only the interior of u_new is written; the boundary is held fixed, so two
+    buffers initialized with the same field can be swapped between steps.
+    """
+    center = u[1:-1, 1:-1]
+    laplacian = (u[2:, 1:-1] - 2*center + u[:-2, 1:-1]) / dx**2 + \
+                (u[1:-1, 2:] - 2*center + u[1:-1, :-2]) / dy**2
+    np.clip(center + coef * laplacian, -1, 1, out=u_new[1:-1, 1:-1])
+
+
+# Fewest interior rows per tile of the threaded 2D step; thinner tiles cost
+# more to dispatch than they save
+MIN_TILE_ROWS = 64
+
+_tile_executor = None
+_tile_executor_workers = 0
+# Held while a step is submitted, so the pool it uses is not shut down meanwhile
+_tile_executor_lock = threading.RLock()
+
+
+def _get_tile_executor(workers):
+    """
+    Get the thread pool shared by all tiled 2D runs, with at least workers threads.
+
+    A smaller pool is replaced and shut down; the tiles already submitted to
+    it still run, and its threads exit once they are done.
+    """
+    global _tile_executor, _tile_executor_workers
+    with _tile_executor_lock:
+        if _tile_executor is None or _tile_executor_workers < workers:
+            previous = _tile_executor
+            _tile_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='diffusion-2d')
+            _tile_executor_workers = workers
+            if previous is not None:
+                previous.shutdown(wait=False)
+        return _tile_executor
+
+
+@atexit.register
+def _shutdown_tile_executor():
+    with _tile_executor_lock:
+        if _tile_executor is not None:
+            _tile_executor.shutdown(wait=False)
+
+
+def _row_tiles(nx, workers, min_rows=MIN_TILE_ROWS):
+    """
+    Split the interior rows 1 .. nx - 2 into at most workers contiguous
+    (start, stop) tiles of at least min_rows rows each.
+    """
+    count = max(1, min(int(workers), (nx - 2) // min_rows))
+    bounds = np.linspace(1, nx - 1, count + 1).round().astype(int).tolist()
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _diffusion_2d_step_tiled(u, u_new, coef, dx, dy, tiles):
+    """
+    One explicit step as _diffusion_2d_step, with the interior rows split
+    into tiles computed on the threads of the shared tile executor.
+
+    Each tile reads its rows of u plus one halo row on either side and
+    writes only its own rows of u_new. Both fields are shared, so the halo
+    exchange is the read of the neighbours' rows of u, which no tile writes
+    during the step. NumPy releases the GIL inside the array operations, so
+    the tiles run in parallel.
+    """
+    with _tile_executor_lock:
+        executor = _get_tile_executor(len(tiles))
+        futures = [executor.submit(_diffusion_2d_step, u[start - 1:stop + 1], u_new[start - 1:stop + 1], coef, dx, dy)
+                   for start, stop in tiles]
+    for future in futures:
+        future.result()
+
+
+def _adi_line_operator(n, r):
+    """
+    Banded form of the implicit half-step operator (I - r * second difference)
+    on the n interior points of a grid line.
+    """
+    ab = np.empty((3, n))
+    ab[0] = -r
+    ab[1] = 1 + 2 * r
+    ab[2] = -r
+    return ab
+
+
+def _adi_2d_step(u, u_new, r, ab_x, ab_y):
+    """
+    One Peaceman-Rachford ADI step from u into u_new, clipped to [-1, 1].
+
+    The first half step is implicit along x and explicit along y, the second
+    the other way round; each solves one tridiagonal system per grid line.
+    The scheme is unconditionally stable and second order in time. Only the
+    interior of u_new is written; the boundary is held fixed.
+    """
+    if u.shape[0] < 3 or u.shape[1] < 3:
+        return
+    center = u[1:-1, 1:-1]
+    rhs = center + r * (u[1:-1, 2:] - 2*center + u[1:-1, :-2])
+    rhs[0] += r * u[0, 1:-1]
+    rhs[-1] += r * u[-1, 1:-1]
+    u_new[1:-1, 1:-1] = solve_banded((1, 1), ab_x, rhs, check_finite=False)
+
+    half = u_new[1:-1, 1:-1]
+    rhs = half + r * (u_new[2:, 1:-1] - 2*half + u_new[:-2, 1:-1])
+    rhs[:, 0] += r * u_new[1:-1, 0]
+    rhs[:, -1] += r * u_new[1:-1, -1]
+    u_new[1:-1, 1:-1] = solve_banded((1, 1), ab_y, rhs.T, check_finite=False).T
+    np.clip(half, -1, 1, out=half)
+
+
+def _frame_stride(nt, output_every=1, max_frames=None):
+    """
+    Number of steps between stored frames, so that at most max_frames of nt
+    steps are kept.
+    """
+    output_every = int(output_every)
+    if output_every < 1:
+        raise ValueError("output_every must be at least 1")
+    if max_frames is None:
+        return output_every
+    max_frames = int(max_frames)
+    if max_frames < 1:
+        raise ValueError("max_frames must be at least 1")
+    return max(output_every, -(-nt // max_frames))
+
+
 def diffusion_2d_solver(nx, ny, dt, d, t_max):
     """
     Solve 2D diffusion equation with initial condition of step function
-    Returns frames as RGB color data
+    Returns frames as RGB color data, a uint8 array of shape (nt, nx, ny, 3)
     """
     print(f"Starting 2D diffusion solver with parameters: nx={nx}, ny={ny}, dt={dt}, d={d}, t_max={t_max}")
     
@@ -172,50 +760,44 @@ def diffusion_2d_solver(nx, ny, dt, d, t_max):
     nt = int(t_max / dt)
     print(f"Number of time steps: {nt}")
     
-    # Initialize field with step function
-    u = np.zeros((nx, ny))
-    for i in range(nx):
-        for j in range(ny):
-            if j >= ny // 2:
-                u[i, j] = 1  # upper part
-            else:
-                u[i, j] = -1  # lower part
+    # Initialize field with step function, double buffered
+    u = _step_function_field(nx, ny)
+    u_new = u.copy()
     
     # Store frames as RGB data
-    frames = []
+    frames = np.empty((nt, nx, ny, 3), dtype=np.uint8)
+    colorize = Colorizer((nx, ny))
     
     # Time stepping
     for step in range(nt):
-        u_new = u.copy()
-        for i in range(1, nx - 1):
-            for j in range(1, ny - 1):
-                laplacian = (u[i+1, j] - 2*u[i, j] + u[i-1, j]) / dx**2 + \
-                           (u[i, j+1] - 2*u[i, j] + u[i, j-1]) / dy**2
-                u_new[i, j] = np.clip(u[i, j] + d * dt * laplacian, -1, 1)
-        u = u_new
+        _diffusion_2d_step(u, u_new, d * dt, dx, dy)
+        u, u_new = u_new, u
         
         # Convert to RGB data
-        rgb_frame = np.zeros((nx, ny, 3), dtype=np.uint8)
-        for i in range(nx):
-            for j in range(ny):
-                value = u[i, j]
-                if value < 0:
-                    # Blue to white
-                    t = abs(value)
-                    rgb_frame[i, j] = [int(255 * t), int(255 * t), 255]
-                else:
-                    # White to red
-                    t = value
-                    rgb_frame[i, j] = [255, int(255 * (1 - t)), int(255 * (1 - t))]
-        
-        frames.append(rgb_frame.tolist())
+        colorize(u, out=frames[step])
 
     return frames, nt, nx, ny
 
-def diffusion_2d_solver_alt(nx=50, ny=50, dt=0.001, d=1.0, t_max=9e-3):
+def diffusion_2d_solver_alt(nx=50, ny=50, dt=0.001, d=1.0, t_max=9e-3, scheme='explicit',
+                            output_every=1, max_frames=None, colormap='bwr', checkpoint=None,
+                            frame_format='rgb', workers=1):
     """
     Solve 2D diffusion equation with initial condition of step function
     Returns frames as RGB color data and metadata
+
+    The explicit scheme reduces dt to its stability limit, so the number of
+    steps grows with nx**2. The implicit 'adi' scheme is stable for any dt
+    and uses the requested one.
+
+    Every step is computed, but only every output_every-th is kept as a
+    frame, together with the last one. max_frames raises the stride further
+    so that at most that many frames are stored.
+
+    Frames are RGB unless frame_format asks for the field itself, either as
+    its uint8 colormap bins ('uint8') or as float16 values ('float16').
+
+    With several workers the explicit step of large grids is split into row
+    tiles computed on a shared thread pool; the results are identical.
     
     Parameters:
     -----------
@@ -229,81 +811,162 @@ def diffusion_2d_solver_alt(nx=50, ny=50, dt=0.001, d=1.0, t_max=9e-3):
         Diffusion coefficient (default 1.0)
     t_max : float, optional
         Maximum simulation time (default 9e-3)
+    scheme : str, optional
+        'explicit' (default) or 'adi' (alternating-direction implicit)
+    output_every : int, optional
+        Keep a frame every output_every steps (default 1)
+    max_frames : int, optional
+        Upper bound on the number of frames kept (default unbounded)
+    colormap : str, optional
+        Name of the colormap, see app.utils.colormap (default 'bwr')
+    checkpoint : RunCheckpoint, optional
+        Checkpoint to resume the run from and save it to, see app.utils.run_checkpoint
+    frame_format : str, optional
+        'rgb' (default), 'uint8' or 'float16', see FRAME_FORMATS
+    workers : int, optional
+        Threads for the explicit step (default 1)
     
     Returns:
     --------
-    frames : list of RGB frames
+    frames : numpy.ndarray
+        Frames of shape (n_frames, nx, ny, 3) for 'rgb', else (n_frames, nx, ny)
     nt : int
         Number of time steps
     nx : int
         Grid size in x direction
     ny : int
         Grid size in y direction
+    times : list of float
+        Simulation time of each frame
+    """
+    info, frame_iter = diffusion_2d_frames(nx, ny, dt, d, t_max, scheme, output_every, max_frames, colormap,
+                                           checkpoint, frame_format, workers)
+
+    # Store frames as RGB data or scalar fields; a checkpointed run already
+    # writes them to its memory-mapped frame file
+    frames = None
+    if checkpoint is None:
+        frames = np.empty((len(info["times"]),) + info["frame_shape"], dtype=info["dtype"])
+    for k, frame in enumerate(frame_iter):
+        if frames is not None:
+            frames[k] = frame
+    if frames is None:
+        frames = checkpoint.frames
+
+    print(f"Generated {len(frames)} frames")
+    return frames, info["nt"], nx, ny, info["times"]
+
+
+def diffusion_2d_frames(nx=50, ny=50, dt=0.001, d=1.0, t_max=9e-3, scheme='explicit',
+                        output_every=1, max_frames=None, colormap='bwr', checkpoint=None,
+                        frame_format='rgb', workers=1):
+    """
+    Set up a 2D diffusion run whose frames are produced one at a time.
+
+    Takes the parameters of diffusion_2d_solver_alt and returns (info, frames):
+    info holds the time step actually used ('dt'), the number of steps ('nt'),
+    the time of every frame ('times') and the shape and dtype of a frame
+    ('frame_shape', 'dtype'); frames is a generator computing the run and
+    yielding each frame, for 'rgb' a uint8 array of shape (nx, ny, 3), as
+    soon as it is reached. The same buffer is yielded every time, so copy
+    a frame to keep it. Only two fields and one frame are held in memory.
+
+    With a checkpoint every frame is also written to the run's frame file.
+    The run continues from its last saved state, first yielding the frames
+    stored with it, and is saved every checkpoint.interval steps and at the
+    end. The checkpoint is closed when the generator finishes.
     """
+    if scheme not in ['explicit', 'adi']:
+        raise ValueError(f"Unknown scheme {scheme}")
+    if frame_format not in FRAME_FORMATS:
+        raise ValueError(f"Unknown frame format {frame_format}")
+
     # Calculate grid spacing
     dx = dy = 1.0 / nx
 
-    # Largest stable time step calculation
-    dt_max = dx**2 / (4 * d)
-    dt = min(0.9 * dt_max, dt)  # ensure stability
-    print(f"Stable time step: dt = {dt:.5e} (max stable dt: {dt_max:.5e})")
+    if scheme == 'explicit':
+        # Largest stable time step calculation
+        dt_max = dx**2 / (4 * d)
+        dt = min(0.9 * dt_max, dt)  # ensure stability
+        print(f"Stable time step: dt = {dt:.5e} (max stable dt: {dt_max:.5e})")
+        tiles = _row_tiles(nx, workers) if workers and workers > 1 else []
+    else:
+        # Half of each direction's second difference is implicit in every half step
+        r = d * dt / (2 * dx**2)
+        ab_x = _adi_line_operator(nx - 2, r)
+        ab_y = _adi_line_operator(ny - 2, r)
+        tiles = []
+        print(f"ADI time step: dt = {dt:.5e}")
 
     # Calculate number of time steps
     nt = int(t_max / dt)
     print(f"Number of time steps: {nt}")
 
-    # Initialize field with step function
-    u = np.zeros((nx, ny))
-    for i in range(nx):
-        for j in range(ny):
-            if j >= ny // 2:
-                u[i, j] = 1  # upper part
-            else:
-                u[i, j] = -1  # lower part
+    # Keep every stride-th step and the last one
+    stride = _frame_stride(nt, output_every, max_frames)
+    kept = list(range(stride, nt + 1, stride))
+    if nt % stride:
+        kept.append(nt)
+    times = [k * dt for k in kept]
+    frame_shape, dtype = FRAME_FORMATS[frame_format]
+    frame_shape = (nx, ny) + frame_shape
+    if frame_format == 'rgb':
+        convert = Colorizer((nx, ny), colormap)
+    elif frame_format == 'uint8':
+        convert = Quantizer((nx, ny))
+    else:
+        def convert(u, out):
+            out[...] = u
+            return out
 
-    # Store frames as RGB data
-    frames = []
-
-    # Time stepping
-    for step in range(nt):
-        # Create a copy for updating
-        u_new = u.copy()
-
-        # Compute diffusion
-        for i in range(1, nx - 1):
-            for j in range(1, ny - 1):
-                # Compute Laplacian
-                laplacian = (u[i+1, j] - 2*u[i, j] + u[i-1, j]) / dx**2 + \
-                            (u[i, j+1] - 2*u[i, j] + u[i, j-1]) / dy**2
-                
-                # Update with diffusion and clip values
-                u_new[i, j] = np.clip(u[i, j] + d * dt * laplacian, -1, 1)
-
-        # Update field
-        u = u_new
+    def generate():
+        # Initialize field with step function, double buffered
+        u = _step_function_field(nx, ny)
+        frame = np.empty(frame_shape, dtype=dtype)
+        start = 0
+        try:
+            state = checkpoint.restore(nt, times, frame_shape, dtype) if checkpoint is not None else None
+            if state is not None:
+                start, u, frame_count = state
+                print(f"Resuming from step {start} with {frame_count} frames")
+                for stored_frame in checkpoint.frames[:frame_count]:
+                    np.copyto(frame, stored_frame)
+                    yield frame
+            u_new = u.copy()
 
-        # Convert to RGB data
-        rgb_frame = np.zeros((nx, ny, 3), dtype=np.uint8)
-        for i in range(nx):
-            for j in range(ny):
-                value = u[i, j]
-                if value < 0:
-                    # Blue to white gradient for negative values
-                    t = abs(value)
-                    rgb_frame[i, j] = [int(255 * t), int(255 * t), 255]
+            # Time stepping
+            for step in range(start, nt):
+                # Compute diffusion into the spare buffer, then swap
+                if len(tiles) > 1:
+                    _diffusion_2d_step_tiled(u, u_new, d * dt, dx, dy, tiles)
+                elif scheme == 'explicit':
+                    _diffusion_2d_step(u, u_new, d * dt, dx, dy)
                 else:
-                    # White to red gradient for positive values
-                    t = value
-                    rgb_frame[i, j] = [255, int(255 * (1 - t)), int(255 * (1 - t))]
+                    _adi_2d_step(u, u_new, r, ab_x, ab_y)
+                u, u_new = u_new, u
 
-        frames.append(rgb_frame.tolist())
+                # Logging for every 10th step
+                if step % 10 == 0:
+                    print(f"Step {step}: min={np.min(u):.3f}, max={np.max(u):.3f}")
 
-        # Logging for every 10th step
-        if step % 10 == 0:
-            print(f"Step {step}: min={np.min(u):.3f}, max={np.max(u):.3f}")
+                # Convert to RGB data or the scalar frame format
+                kept_step = (step + 1) % stride == 0 or step == nt - 1
+                if kept_step:
+                    convert(u, out=frame)
+                # Save before handing the frame out, the consumer may never come back
+                if checkpoint is not None:
+                    if kept_step:
+                        checkpoint.append_frame(frame)
+                    if checkpoint.interval and (step + 1) % checkpoint.interval == 0 or step == nt - 1:
+                        checkpoint.save(step + 1, u)
+                if kept_step:
+                    yield frame
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
 
-    print(f"Generated {len(frames)} frames")
-    return frames, nt, nx, ny
+    info = {"dt": dt, "nt": nt, "times": times, "frame_shape": frame_shape, "dtype": np.dtype(dtype).name}
+    return info, generate()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+"""
+Benchmark the 2D diffusion solver against the original loop implementation.
+
+Usage:
+    python benchmarks/diffusion_2d.py [--sizes 50 100 200] [--t-max 1e-3] [--skip-reference]
+
+For every grid size both implementations are run with the same parameters
+and the wall time is reported together with the largest difference between
+their frames, in color levels. The current solver colorizes through a
+256-entry lookup table, so frames differ from the reference by at most a
+level or two. The reference returns nested lists, as the solver originally did.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.utils.solid_diffusion import diffusion_2d_solver_alt
+
+
+def reference_diffusion_2d(nx, ny, dt, d, t_max):
+    """
+    The original per-cell implementation of diffusion_2d_solver_alt.
+    """
+    dx = dy = 1.0 / nx
+    dt_max = dx**2 / (4 * d)
+    dt = min(0.9 * dt_max, dt)
+    nt = int(t_max / dt)
+
+    u = np.zeros((nx, ny))
+    for i in range(nx):
+        for j in range(ny):
+            if j >= ny // 2:
+                u[i, j] = 1
+            else:
+                u[i, j] = -1
+
+    frames = []
+    for step in range(nt):
+        u_new = u.copy()
+        for i in range(1, nx - 1):
+            for j in range(1, ny - 1):
+                laplacian = (u[i+1, j] - 2*u[i, j] + u[i-1, j]) / dx**2 + \
+                            (u[i, j+1] - 2*u[i, j] + u[i, j-1]) / dy**2
+                u_new[i, j] = np.clip(u[i, j] + d * dt * laplacian, -1, 1)
+        u = u_new
+
+        rgb_frame = np.zeros((nx, ny, 3), dtype=np.uint8)
+        for i in range(nx):
+            for j in range(ny):
+                value = u[i, j]
+                if value < 0:
+                    t = abs(value)
+                    rgb_frame[i, j] = [int(255 * t), int(255 * t), 255]
+                else:
+                    t = value
+                    rgb_frame[i, j] = [255, int(255 * (1 - t)), int(255 * (1 - t))]
+        frames.append(rgb_frame.tolist())
+
+    return frames, nt, nx, ny
+
+
+def timed(func, *args):
+    # The solvers log every few steps; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100, 200])
+    parser.add_argument('--dt', type=float, default=0.001)
+    parser.add_argument('--d', type=float, default=1.0)
+    parser.add_argument('--t-max', type=float, default=1e-3)
+    parser.add_argument('--skip-reference', action='store_true', help="only time the current implementation")
+    args = parser.parse_args()
+
+    print(f"{'grid':>10} {'steps':>6} {'current (s)':>12} {'reference (s)':>14} {'speedup':>8}  max diff")
+    for n in args.sizes:
+        (frames, nt, _, _, _), elapsed = timed(diffusion_2d_solver_alt, n, n, args.dt, args.d, args.t_max)
+        if args.skip_reference:
+            print(f"{n:>4} x {n:<4} {nt:>6} {elapsed:>12.3f} {'-':>14} {'-':>8}  -")
+            continue
+        (reference, _, _, _), reference_elapsed = timed(reference_diffusion_2d, n, n, args.dt, args.d, args.t_max)
+        diff = np.abs(frames.astype(int) - np.array(reference)).max() if len(reference) else 0
+        print(f"{n:>4} x {n:<4} {nt:>6} {elapsed:>12.3f} {reference_elapsed:>14.3f} "
+              f"{reference_elapsed / elapsed:>7.1f}x  {diff}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark how the tiled explicit 2D diffusion step scales with worker threads.
+
+Usage:
+    python benchmarks/diffusion_2d_scaling.py [--sizes 1000 2000 4000] [--workers 1 2 4 8] [--steps 20]
+
+For every grid size the step is timed with the interior rows split into one
+row tile per worker, each computed on the shared thread pool of the 2D
+solver; one worker runs the untiled step on the calling thread. The report
+gives the time per step, the speedup over one worker and the parallel
+efficiency. Every tiled result is checked against the untiled one.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.utils.solid_diffusion import (
+    _diffusion_2d_step, _diffusion_2d_step_tiled, _get_tile_executor, _row_tiles, _step_function_field
+)
+
+
+def run(n, workers, steps, d=1.0):
+    """
+    Run steps explicit steps on an n x n grid, returns (field, seconds per step).
+    """
+    dx = dy = 1.0 / n
+    coef = d * 0.9 * dx**2 / (4 * d)
+    u = _step_function_field(n, n)
+    u_new = u.copy()
+    tiles = _row_tiles(n, workers)
+    executor = _get_tile_executor(workers) if len(tiles) > 1 else None
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        if executor is not None:
+            _diffusion_2d_step_tiled(u, u_new, coef, dx, dy, tiles, executor)
+        else:
+            _diffusion_2d_step(u, u_new, coef, dx, dy)
+        u, u_new = u_new, u
+    return u, (time.perf_counter() - start) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 4000])
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[w for w in [1, 2, 4, 8, 16, 32] if w <= (os.cpu_count() or 1)])
+    parser.add_argument('--steps', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'grid':>11} {'workers':>8} {'ms/step':>9} {'speedup':>8} {'efficiency':>11}")
+    for n in args.sizes:
+        reference, baseline = run(n, 1, args.steps)
+        for workers in args.workers:
+            if workers == 1:
+                field, elapsed = reference, baseline
+            else:
+                field, elapsed = run(n, workers, args.steps)
+                assert np.array_equal(field, reference), "tiled step differs from the untiled one"
+            speedup = baseline / elapsed
+            print(f"{n:>5} x {n:<5} {workers:>8} {elapsed * 1000:>9.1f} {speedup:>7.2f}x {speedup / workers:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,4 +21,44 @@ class Config:
     
     SESSION_PROTECTION = 'strong' 
     SESSION_COOKIE_NAME = 'umtc_session_cookie'
-    PERMANENT_SESSION_LIFETIME = timedelta(days=30)  
\ No newline at end of file
+    PERMANENT_SESSION_LIFETIME = timedelta(days=30)
+
+    # Cache of factorized diffusion operators, keyed on (d, r, ns)
+    DIFFUSION_CACHE_MAX_ENTRIES = int(os.getenv('DIFFUSION_CACHE_MAX_ENTRIES', 64))
+    DIFFUSION_CACHE_MAX_BYTES = int(os.getenv('DIFFUSION_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    # Compiled CasADi solvers, one per (ns, method)
+    CASADI_CACHE_MAX_ENTRIES = int(os.getenv('CASADI_CACHE_MAX_ENTRIES', 16))
+
+    # Benchmark the diffusion solver backends when the app starts
+    DIFFUSION_BENCHMARK_ON_STARTUP = os.getenv('DIFFUSION_BENCHMARK_ON_STARTUP', 'false').lower() in ['true', '1', 'yes']
+
+    # Worker processes for /diffusion/batch (0 or 1 solves on the request thread)
+    DIFFUSION_BATCH_WORKERS = int(os.getenv('DIFFUSION_BATCH_WORKERS', 0))
+    DIFFUSION_BATCH_CHUNK_SIZE = int(os.getenv('DIFFUSION_BATCH_CHUNK_SIZE', 256))
+
+    # Cache of finished /diffusion, /ecm and /diffusion_2d results, keyed on their inputs.
+    # Set RESULT_CACHE_DIR to share results between worker processes through the filesystem.
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 256))
+    RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 128 * 1024 * 1024))
+    RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', 3600))
+    RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', '')
+    RESULT_CACHE_DISK_MAX_BYTES = int(os.getenv('RESULT_CACHE_DISK_MAX_BYTES', 1024 * 1024 * 1024))
+
+    # Upper bound on the frames returned by /diffusion_2d; longer runs are decimated
+    DIFFUSION_2D_MAX_FRAMES = int(os.getenv('DIFFUSION_2D_MAX_FRAMES', 1000))
+
+    # Threads for the explicit /diffusion_2d step; large grids are split into row tiles
+    # of at least 64 rows computed in parallel (1 computes on the request thread)
+    DIFFUSION_2D_WORKERS = int(os.getenv('DIFFUSION_2D_WORKERS', 1))
+
+    # Checkpoints and memory-mapped frames of /diffusion_2d runs started with a run_id.
+    # State is saved every DIFFUSION_2D_CHECKPOINT_INTERVAL steps (0: only when the run
+    # finishes) so a run killed by a worker timeout or restart resumes when requested
+    # again, and frames can be fetched by index from /diffusion_2d/<run_id>/frames.
+    # Defaults to the instance folder; runs untouched for DIFFUSION_2D_CHECKPOINT_TTL
+    # seconds are removed. Every user keeps at most DIFFUSION_2D_MAX_RUNS runs, whose
+    # files count against the storage limit; older runs are removed to make room.
+    DIFFUSION_2D_CHECKPOINT_DIR = os.getenv('DIFFUSION_2D_CHECKPOINT_DIR', '')
+    DIFFUSION_2D_CHECKPOINT_INTERVAL = int(os.getenv('DIFFUSION_2D_CHECKPOINT_INTERVAL', 500))
+    DIFFUSION_2D_CHECKPOINT_TTL = int(os.getenv('DIFFUSION_2D_CHECKPOINT_TTL', 24 * 3600))
+    DIFFUSION_2D_MAX_RUNS = int(os.getenv('DIFFUSION_2D_MAX_RUNS', 3))
@@ -1,8 +1,59 @@
 import React, { useEffect, useRef } from 'react';
 
+const LUT_SIZE = 256;
+
+// Decode an IEEE 754 half precision bit pattern
+const halfToFloat = (bits) => {
+  const sign = bits & 0x8000 ? -1 : 1;
+  const exponent = (bits >> 10) & 0x1f;
+  const fraction = bits & 0x3ff;
+  if (exponent === 0) return sign * fraction * 2 ** -24;
+  if (exponent === 31) return fraction ? NaN : sign * Infinity;
+  return sign * (1 + fraction / 1024) * 2 ** (exponent - 15);
+};
+
+// Colormap bin of a value, as app/utils/colormap.py Quantizer computes it
+const binOf = (value, [low, high]) => (
+  Math.min(LUT_SIZE - 1, Math.max(0, Math.floor((value - low) / (high - low) * LUT_SIZE)))
+);
+
+// Bin of every float16 bit pattern, so a frame is binned with one lookup per cell
+const halfBinTables = {};
+const halfBinTable = (range) => {
+  const key = range.join(',');
+  if (!halfBinTables[key]) {
+    const table = new Uint8Array(65536);
+    for (let bits = 0; bits < 65536; bits++) {
+      table[bits] = binOf(halfToFloat(bits), range) || 0;
+    }
+    halfBinTables[key] = table;
+  }
+  return halfBinTables[key];
+};
+
+// Field value of cell k of a scalar frame, for probing
+const cellValue = (data, k, { frame_format: frameFormat, value_range: range }) => {
+  if (frameFormat === 'float16') {
+    return halfToFloat(new DataView(data.buffer, data.byteOffset, data.byteLength).getUint16(k * 2, true));
+  }
+  return range[0] + (data[k] + 0.5) * (range[1] - range[0]) / LUT_SIZE;
+};
+
 const Heatmap = ({ data, metadata }) => {
   const canvasRef = useRef(null);
 
+  // Show the field value under the cursor for scalar frames
+  const handleMouseMove = (event) => {
+    const canvas = canvasRef.current;
+    if (!canvas || !data || !metadata || (metadata.frame_format || 'rgb') === 'rgb') return;
+    const { nx, ny } = metadata;
+    const rect = canvas.getBoundingClientRect();
+    const x = Math.floor((event.clientX - rect.left) / rect.width * nx);
+    const y = Math.floor((event.clientY - rect.top) / rect.height * ny);
+    if (x < 0 || x >= nx || y < 0 || y >= ny) return;
+    canvas.title = `u(${x}, ${y}) = ${cellValue(data, y * ny + x, metadata).toFixed(4)}`;
+  };
+
   useEffect(() => {
     if (!data || !metadata) {
       console.log('Heatmap: Missing data or metadata', { data, metadata });
@@ -13,7 +64,8 @@ const Heatmap = ({ data, metadata }) => {
     if (!canvas) return;
 
     const ctx = canvas.getContext('2d');
-    const { nx, ny } = metadata;
+    const { nx, ny, lut } = metadata;
+    const frameFormat = metadata.frame_format || 'rgb';
 
     // Set canvas size and scale
     canvas.width = nx;
@@ -30,17 +82,41 @@ const Heatmap = ({ data, metadata }) => {
     const imageData = ctx.createImageData(nx, ny);
     const imageDataArray = imageData.data;
 
-    // Convert RGB data to ImageData
-    for (let y = 0; y < ny; y++) {
-      for (let x = 0; x < nx; x++) {
-        const i = (y * nx + x) * 4;
-        const rgb = data[y][x];
-        
-        // Ensure rgb values are within 0-255 range
-        imageDataArray[i] = Math.min(255, Math.max(0, rgb[0]));     // R
-        imageDataArray[i + 1] = Math.min(255, Math.max(0, rgb[1])); // G
-        imageDataArray[i + 2] = Math.min(255, Math.max(0, rgb[2])); // B
-        imageDataArray[i + 3] = 255;    // Alpha
+    if (frameFormat === 'rgb') {
+      // Convert RGB data to ImageData; data is a flat uint8 frame of shape (nx, ny, 3)
+      for (let y = 0; y < ny; y++) {
+        for (let x = 0; x < nx; x++) {
+          const i = (y * nx + x) * 4;
+          const j = (y * ny + x) * 3;
+
+          imageDataArray[i] = data[j];         // R
+          imageDataArray[i + 1] = data[j + 1]; // G
+          imageDataArray[i + 2] = data[j + 2]; // B
+          imageDataArray[i + 3] = 255;    // Alpha
+        }
+      }
+    } else {
+      // Scalar frames of shape (nx, ny) are colorized here through the colormap
+      // lookup table; uint8 frames already hold the bin of every cell
+      let bins = data;
+      if (frameFormat === 'float16') {
+        const table = halfBinTable(metadata.value_range);
+        const view = new DataView(data.buffer, data.byteOffset, data.byteLength);
+        bins = new Uint8Array(nx * ny);
+        for (let k = 0; k < bins.length; k++) {
+          bins[k] = table[view.getUint16(k * 2, true)];
+        }
+      }
+      for (let y = 0; y < ny; y++) {
+        for (let x = 0; x < nx; x++) {
+          const i = (y * nx + x) * 4;
+          const color = lut[bins[y * ny + x]];
+
+          imageDataArray[i] = color[0];
+          imageDataArray[i + 1] = color[1];
+          imageDataArray[i + 2] = color[2];
+          imageDataArray[i + 3] = 255;
+        }
       }
     }
 
@@ -55,9 +131,17 @@ const Heatmap = ({ data, metadata }) => {
 
     // Draw gradient
     const gradient = ctx.createLinearGradient(scaleX, scaleY, scaleX + scaleWidth, scaleY);
-    gradient.addColorStop(0, 'rgb(0,0,255)');   // Blue
-    gradient.addColorStop(0.5, 'rgb(255,255,255)'); // White
-    gradient.addColorStop(1, 'rgb(255,0,0)');   // Red
+    if (lut) {
+      // Sample the colormap the frames were colorized with
+      for (let stop = 0; stop <= 8; stop++) {
+        const [r, g, b] = lut[Math.min(LUT_SIZE - 1, Math.floor(stop / 8 * LUT_SIZE))];
+        gradient.addColorStop(stop / 8, `rgb(${r},${g},${b})`);
+      }
+    } else {
+      gradient.addColorStop(0, 'rgb(0,0,255)');   // Blue
+      gradient.addColorStop(0.5, 'rgb(255,255,255)'); // White
+      gradient.addColorStop(1, 'rgb(255,0,0)');   // Red
+    }
 
     ctx.fillStyle = gradient;
     ctx.fillRect(scaleX, scaleY, scaleWidth, scaleHeight);
@@ -75,6 +159,7 @@ const Heatmap = ({ data, metadata }) => {
   return (
     <canvas
       ref={canvasRef}
+      onMouseMove={handleMouseMove}
       style={{
         width: '100%',
         height: '100%',
@@ -15,12 +15,22 @@ import {
 import PlayCircleFilledWhiteIcon from '@mui/icons-material/PlayCircleFilledWhite';
 import PauseCircleFilledIcon from '@mui/icons-material/PauseCircleFilled';
 import ReplayIcon from '@mui/icons-material/Replay';
-import pako from 'pako';
-import { diffusion2D } from '../services/api';
+import { diffusion2DStream, fetchDiffusion2DFrames, deleteDiffusion2DRun } from '../services/api';
 import Layout from '../components/Layout';
 import CustomButton from '../components/CustomButton';
 import Heatmap from '../components/Heatmap';
 
+// Frames kept in memory; the rest are fetched from the run on the server
+// in windows of FRAME_WINDOW frames when playback or the slider reaches them
+const FRAME_CACHE_SIZE = 240;
+const FRAME_WINDOW = 30;
+
+const newRunId = () => (
+  window.crypto?.randomUUID
+    ? window.crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`
+);
+
 const DiffusionAnimation = () => {
   const navigate = useNavigate();
   const [params, setParams] = useState({
@@ -28,7 +38,8 @@ const DiffusionAnimation = () => {
     ny: 50,
     dt: 0.0005,
     d: 1.0,
-    t_max: 0.1
+    t_max: 0.1,
+    max_frames: 300
   });
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
@@ -36,7 +47,8 @@ const DiffusionAnimation = () => {
   const [estimatedTime, setEstimatedTime] = useState(0);
   const progressRef = useRef(null);
   const [animationData, setAnimationData] = useState({
-    frames: [],
+    runId: null,
+    frameCount: 0,
     metadata: null,
     currentFrame: 0,
     isPlaying: false,
@@ -47,30 +59,70 @@ const DiffusionAnimation = () => {
   const frameRef = useRef(0);
   const lastTimeRef = useRef(0);
 
+  // Least recently used frames by index, and the windows being fetched
+  const frameCacheRef = useRef(new Map());
+  const pendingWindowsRef = useRef(new Set());
+  const shownFrameRef = useRef(null);
+  const runIdRef = useRef(null);
+  const [, setCacheVersion] = useState(0);
+
+  const cacheFrame = (index, frame) => {
+    const cache = frameCacheRef.current;
+    cache.delete(index);
+    cache.set(index, frame);
+    while (cache.size > FRAME_CACHE_SIZE) {
+      cache.delete(cache.keys().next().value);
+    }
+  };
+
+  const fetchWindow = (runId, index) => {
+    const start = index - (index % FRAME_WINDOW);
+    if (frameCacheRef.current.has(index) || pendingWindowsRef.current.has(start)) return;
+    pendingWindowsRef.current.add(start);
+    fetchDiffusion2DFrames(runId, { start, stop: start + FRAME_WINDOW })
+      .then(({ metadata, frames }) => {
+        // Ignore windows of a run that has since been replaced
+        if (runIdRef.current !== runId) return;
+        frames.forEach((frame, k) => cacheFrame(metadata.indices[k], frame));
+        setCacheVersion(version => version + 1);
+      })
+      .catch(err => setError(err.message))
+      .finally(() => pendingWindowsRef.current.delete(start));
+  };
+
+  // Load the window of the current frame and the next one ahead of playback
+  useEffect(() => {
+    const { runId, frameCount, currentFrame } = animationData;
+    if (!runId || !frameCount) return;
+    fetchWindow(runId, currentFrame);
+    fetchWindow(runId, (currentFrame + FRAME_WINDOW) % frameCount);
+  }, [animationData.runId, animationData.frameCount, animationData.currentFrame]);
+
   const animate = (timestamp) => {
-    if (!animationData.frames.length) return;
+    if (!animationData.frameCount) return;
     
     if (!lastTimeRef.current) lastTimeRef.current = timestamp;
     const delta = timestamp - lastTimeRef.current;
     
     if (delta > 1000 / (30 * animationData.playbackSpeed)) {
-      setAnimationData(prev => ({
-        ...prev,
-        currentFrame: (prev.currentFrame + 1) % prev.frames.length
-      }));
+      setAnimationData(prev => {
+        const next = (prev.currentFrame + 1) % prev.frameCount;
+        // Hold the current frame while the next one is being fetched
+        return frameCacheRef.current.has(next) ? { ...prev, currentFrame: next } : prev;
+      });
       lastTimeRef.current = timestamp;
     }
     animationRef.current = requestAnimationFrame(animate);
   };
 
   useEffect(() => {
-    if (animationData.isPlaying && animationData.frames.length) {
+    if (animationData.isPlaying && animationData.frameCount) {
       animationRef.current = requestAnimationFrame(animate);
     } else {
       cancelAnimationFrame(animationRef.current);
     }
     return () => cancelAnimationFrame(animationRef.current);
-  }, [animationData.isPlaying, animationData.playbackSpeed, animationData.frames.length]);
+  }, [animationData.isPlaying, animationData.playbackSpeed, animationData.frameCount]);
 
   const handleParamChange = (key) => (event) => {
     const value = parseFloat(event.target.value);
@@ -78,7 +130,7 @@ const DiffusionAnimation = () => {
   };
 
   const handlePlayPause = () => {
-    if (!animationData.frames.length) return;
+    if (!animationData.frameCount) return;
     setAnimationData(prev => ({ ...prev, isPlaying: !prev.isPlaying }));
   };
 
@@ -124,54 +176,48 @@ const DiffusionAnimation = () => {
     progressRef.current = requestAnimationFrame(updateProgress);
 
     try {
-      const response = await diffusion2D(params);
-      
-      // Cancel progress animation
-      if (progressRef.current) {
-        cancelAnimationFrame(progressRef.current);
-      }
-      setProgress(100);
-      
-      if (!(response.data instanceof ArrayBuffer)) {
-        throw new Error('Invalid response data');
+      let totalFrames = 0;
+      let receivedFrames = 0;
+      // The server keeps the frames of the run, so only a window of them is held here
+      if (animationData.runId) {
+        deleteDiffusion2DRun(animationData.runId).catch(() => {});
       }
-      
-      const compressed = new Uint8Array(response.data);
-      console.log('Compressed data length:', compressed.length);
-      
-      try {
-        const decompressed = pako.ungzip(compressed, { to: 'string' });
-        
-        const parsedData = JSON.parse(decompressed);
-        const { metadata, frames } = parsedData;
-        
-        // Log sample of first frame
-        const sampleSize = 5;
-        const sample = frames[0].slice(0, sampleSize).map(row => row.slice(0, sampleSize));
-
-        // Calculate statistics for first frame
-        const flatFirstFrame = frames[0].flat();
-
-        if (!Array.isArray(frames) || 
-            frames[0]?.length !== metadata.nx || 
-            frames[0][0]?.length !== metadata.ny
-        ) {
-          throw new Error('Invalid data format');
+      const runId = newRunId();
+      runIdRef.current = runId;
+      frameCacheRef.current = new Map();
+      pendingWindowsRef.current = new Set();
+      shownFrameRef.current = null;
+      // Keyframes plus deltas keep long runs an order of magnitude smaller;
+      // uint8 frames are colorized by Heatmap, a third of the RGB size
+      await diffusion2DStream({ ...params, codec: 'delta', frame_format: 'uint8', run_id: runId }, {
+        onHeader: (metadata) => {
+          // Progress now follows the frames actually received
+          if (progressRef.current) {
+            cancelAnimationFrame(progressRef.current);
+          }
+          totalFrames = metadata.shape[0];
+          setAnimationData({
+            runId,
+            frameCount: 0,
+            metadata,
+            currentFrame: 0,
+            isPlaying: false,
+            playbackSpeed: 1
+          });
+        },
+        onFrame: (frame) => {
+          cacheFrame(receivedFrames, frame);
+          receivedFrames += 1;
+          setProgress(totalFrames ? (receivedFrames / totalFrames) * 100 : 100);
+          // Start playing as soon as the first frame is in
+          setAnimationData(prev => ({
+            ...prev,
+            frameCount: receivedFrames,
+            isPlaying: receivedFrames === 1 ? true : prev.isPlaying
+          }));
         }
-        
-        setAnimationData({
-          frames,
-          metadata,
-          currentFrame: 0,
-          isPlaying: true,
-          playbackSpeed: 1
-        });
-        
-      } catch (decompressError) {
-        console.error('Decompression error:', decompressError);
-        throw new Error(`Error decompressing data: ${decompressError.message}`);
-      }
-  
+      });
+      setProgress(100);
     } catch (err) {
       console.error('Error:', err);
       setError(err.message);
@@ -180,15 +226,22 @@ const DiffusionAnimation = () => {
     }
   };
 
-  // Cleanup progress animation on unmount
+  // Cleanup progress animation and the run's frames on the server on unmount
   useEffect(() => {
     return () => {
       if (progressRef.current) {
         cancelAnimationFrame(progressRef.current);
       }
+      if (runIdRef.current) {
+        deleteDiffusion2DRun(runIdRef.current).catch(() => {});
+      }
     };
   }, []);
 
+  // Keep showing the last frame while a scrubbed-to one is being fetched
+  const currentFrameData = frameCacheRef.current.get(animationData.currentFrame) || shownFrameRef.current;
+  shownFrameRef.current = currentFrameData;
+
   return (
     <Layout title="Calculation" subTitle="Diffusion Animation">
       <Box component="form" onSubmit={handleSubmit} sx={{ mb: 4 }}>
@@ -203,7 +256,8 @@ const DiffusionAnimation = () => {
             { label: 'Grid Size Y (ny)', key: 'ny', min: 10, max: 200 },
             { label: 'Time Step (dt)', key: 'dt', step: 0.0001 },
             { label: 'Diffusion Coeff (D)', key: 'd', step: 0.1 },
-            { label: 'Max Time (t_max)', key: 't_max', step: 0.1 }
+            { label: 'Max Time (t_max)', key: 't_max', step: 0.1 },
+            { label: 'Max Frames', key: 'max_frames', min: 1, max: 1000 }
           ].map(({ label, key, min, max, step }) => (
             <TextField
               key={key}
@@ -239,7 +293,7 @@ const DiffusionAnimation = () => {
           >
             {loading ? (
               <CircularProgress size={24} />
-            ) : animationData.frames.length ? (
+            ) : animationData.frameCount ? (
               'Restart Simulation'
             ) : (
               'Start Simulation'
@@ -249,7 +303,7 @@ const DiffusionAnimation = () => {
           <CustomButton
             color="secondary"
             onClick={handlePlayPause}
-            disabled={!animationData.frames.length}
+            disabled={!animationData.frameCount}
             sx={{ width: 140, height: 48 }}
           >
             {animationData.isPlaying ? (
@@ -262,7 +316,7 @@ const DiffusionAnimation = () => {
           <CustomButton
             color="secondary"
             onClick={handleReset}
-            disabled={!animationData.frames.length}
+            disabled={!animationData.frameCount}
             sx={{ width: 140, height: 48 }}
           >
             <ReplayIcon fontSize="large" />
@@ -311,7 +365,7 @@ const DiffusionAnimation = () => {
         </Typography>
       )}
 
-      {animationData.frames.length > 0 && (
+      {animationData.frameCount > 0 && (
         <Box sx={{ 
           width: '100%',
           height: '70vh',
@@ -322,7 +376,7 @@ const DiffusionAnimation = () => {
           boxShadow: 3
         }}>
           <Heatmap
-            data={animationData.frames[animationData.currentFrame]}
+            data={currentFrameData}
             metadata={animationData.metadata}
           />
           
@@ -340,7 +394,7 @@ const DiffusionAnimation = () => {
             <Slider
               value={animationData.currentFrame}
               min={0}
-              max={Math.max(0, animationData.frames.length - 1)}
+              max={Math.max(0, animationData.frameCount - 1)}
               onChange={(_, val) => setAnimationData(prev => ({
                 ...prev,
                 currentFrame: val
@@ -349,7 +403,8 @@ const DiffusionAnimation = () => {
             />
             
             <Typography variant="body2" color="white">
-              {`Frames: ${animationData.currentFrame + 1}/${animationData.frames.length}`}
+              {`Frames: ${animationData.currentFrame + 1}/${animationData.frameCount}`}
+              {animationData.metadata?.times && ` (t = ${animationData.metadata.times[animationData.currentFrame].toPrecision(3)})`}
             </Typography>
             
             <TextField
@@ -1,5 +1,6 @@
 // api.js
 import axios from 'axios';
+import { FRAME_MIMETYPE, createFrameStreamDecoder, decodeFrames } from './frameCodec';
 
 const API_BASE_URL = 'http://localhost:5001/api'; 
 
@@ -64,25 +65,47 @@ export const batchDiffusion = (file) => {
   });
 };
 
-export const diffusion2D = (params) => {
-  return axios.post(`${API_BASE_URL}/calculation/diffusion_2d`, params, {
+// Stream a 2D run, calling onHeader with the metadata and onFrame with every
+// frame while the server is still computing the rest
+export const diffusion2DStream = async (params, { onHeader, onFrame }) => {
+  const response = await fetch(`${API_BASE_URL}/calculation/diffusion_2d`, {
+    method: 'POST',
+    credentials: 'include',
+    headers: { 'Content-Type': 'application/json', Accept: FRAME_MIMETYPE },
+    body: JSON.stringify({ ...params, stream: true })
+  });
+  if (!response.ok) {
+    const body = await response.json().catch(() => ({}));
+    throw new Error(body.error || `Request failed with status ${response.status}`);
+  }
+
+  const decode = createFrameStreamDecoder({ onHeader, onFrame });
+  const reader = response.body.getReader();
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    decode(value);
+  }
+  decode();
+};
+
+// Fetch frames start, start + step, ... below stop of a run started with a
+// run_id; resolves to { metadata, frames } with metadata.indices the frame
+// indices returned
+export const fetchDiffusion2DFrames = (runId, { start = 0, stop, step = 1 } = {}) => {
+  return axios.get(`${API_BASE_URL}/calculation/diffusion_2d/${encodeURIComponent(runId)}/frames`, {
+    params: { start, stop, step },
+    headers: { Accept: FRAME_MIMETYPE },
     withCredentials: true,
     responseType: 'arraybuffer'
-  }).then(response => {
-    return response;
-  }).catch(error => {
-    console.error('[API] Request error:', {
-      error: error.message,
-      config: error.config,
-      response: error.response ? {
-        status: error.response.status,
-        data: error.response.data 
-      } : undefined
-    });
-    throw error;
-  });
+  }).then(response => decodeFrames(response.data));
 };
 
+export const deleteDiffusion2DRun = (runId) => {
+  return axios.delete(`${API_BASE_URL}/calculation/diffusion_2d/${encodeURIComponent(runId)}`, {
+    withCredentials: true
+  });
+};
 
 export const uploadFile = (file) => {
   const formData = new FormData();
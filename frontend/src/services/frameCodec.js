@@ -0,0 +1,160 @@
+// Decoder for the binary frame format of /calculation/diffusion_2d
+// (see app/utils/frame_codec.py): the magic "DFRM", a little-endian uint32
+// header length, a JSON header and the frames. With the "raw" codec the
+// frames follow back to back; with "delta" each frame is a record of a uint8
+// type, a uint32 payload length and the payload, either a keyframe or the
+// runs of pixels that changed since the previous frame. A streamed body
+// (header.streamed) sends raw frames as keyframe records too and ends with an
+// END record, or an ERROR record holding the JSON {"error": message} if the
+// run failed. Frames are returned as flat byte arrays, whatever the dtype in
+// the header.
+export const FRAME_MIMETYPE = 'application/x-diffusion-frames';
+
+const KEYFRAME = 0;
+const ERROR = 2;
+const END = 3;
+const RECORD_PREFIX = 5;
+const ITEM_SIZES = { uint8: 1, float16: 2 };
+
+// Bytes per grid cell: RGB frames have a trailing channel axis, scalar ones
+// hold one uint8 or float16 value per cell
+const cellSize = ({ shape, dtype }) => (shape[3] || 1) * (ITEM_SIZES[dtype] || 1);
+
+// Rebuild a frame from a delta record payload and the previous frame. The
+// payload is the uint32 length of the run table, the run table of varint
+// (gap, pixel count) pairs and the new values of the changed pixels.
+const applyDelta = (previous, payload, cellBytes) => {
+  const frame = previous.slice();
+  const tableEnd = 4 + new DataView(payload.buffer, payload.byteOffset, 4).getUint32(0, true);
+  let offset = 4;
+  const readVarint = () => {
+    let value = 0;
+    let scale = 1;
+    let byte;
+    do {
+      byte = payload[offset++];
+      value += (byte & 0x7f) * scale;
+      scale *= 128;
+    } while (byte & 0x80);
+    return value;
+  };
+
+  let pixel = 0;
+  let position = tableEnd;
+  while (offset < tableEnd) {
+    pixel += readVarint();
+    const length = readVarint() * cellBytes;
+    frame.set(payload.subarray(position, position + length), pixel * cellBytes);
+    position += length;
+    pixel += length / cellBytes;
+  }
+  return frame;
+};
+
+const decodeRecord = (previous, recordType, payload, cellBytes) => (
+  recordType === KEYFRAME ? payload.slice() : applyDelta(previous, payload, cellBytes)
+);
+
+export const decodeFrames = (buffer) => {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== 'DFRM') {
+    throw new Error('Invalid frame data');
+  }
+  const headerLength = view.getUint32(4, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+
+  const [frameCount, nx, ny] = header.shape;
+  const cellBytes = cellSize(header);
+  const frameSize = nx * ny * cellBytes;
+  let offset = 8 + headerLength;
+  const frames = [];
+  for (let k = 0; k < frameCount; k++) {
+    if (header.codec === 'delta') {
+      const recordType = view.getUint8(offset);
+      const length = view.getUint32(offset + 1, true);
+      const payload = new Uint8Array(buffer, offset + RECORD_PREFIX, length);
+      frames.push(decodeRecord(frames[k - 1], recordType, payload, cellBytes));
+      offset += RECORD_PREFIX + length;
+    } else {
+      // One view per frame, without copying the buffer
+      frames.push(new Uint8Array(buffer, offset + k * frameSize, frameSize));
+    }
+  }
+  return { metadata: header, frames };
+};
+
+// Incremental decoder for a streamed response in the same format. Returns a
+// function to call with every received chunk, and without one once the body
+// has ended; onHeader is called once the header is complete and onFrame with
+// each frame as soon as all of its bytes have arrived. It throws on an ERROR
+// record and on a streamed body that ends without its END record.
+export const createFrameStreamDecoder = ({ onHeader, onFrame }) => {
+  let pending = new Uint8Array(0);
+  let header = null;
+  let frameSize = 0;
+  let cellBytes = 0;
+  let previous = null;
+  let ended = false;
+
+  // Take the next complete frame off pending, or return null
+  const nextFrame = () => {
+    if (ended) return null;
+    if (header.codec !== 'delta' && !header.streamed) {
+      if (frameSize === 0 || pending.length < frameSize) return null;
+      const frame = pending.slice(0, frameSize);
+      pending = pending.subarray(frameSize);
+      return frame;
+    }
+    if (pending.length < RECORD_PREFIX) return null;
+    const view = new DataView(pending.buffer, pending.byteOffset, pending.byteLength);
+    const length = view.getUint32(1, true);
+    if (pending.length < RECORD_PREFIX + length) return null;
+    const recordType = pending[0];
+    const payload = pending.subarray(RECORD_PREFIX, RECORD_PREFIX + length);
+    pending = pending.subarray(RECORD_PREFIX + length);
+    if (recordType === ERROR) {
+      throw new Error(JSON.parse(new TextDecoder().decode(payload)).error);
+    }
+    if (recordType === END) {
+      ended = true;
+      return null;
+    }
+    previous = decodeRecord(previous, recordType, payload, cellBytes);
+    return previous;
+  };
+
+  return (chunk) => {
+    if (chunk === undefined) {
+      if (!header || (header.streamed && !ended)) {
+        throw new Error('Frame stream ended early');
+      }
+      return;
+    }
+
+    const merged = new Uint8Array(pending.length + chunk.length);
+    merged.set(pending);
+    merged.set(chunk, pending.length);
+    pending = merged;
+
+    if (!header) {
+      if (pending.length < 8) return;
+      const magic = String.fromCharCode(...pending.subarray(0, 4));
+      if (magic !== 'DFRM') {
+        throw new Error('Invalid frame data');
+      }
+      const headerLength = new DataView(pending.buffer).getUint32(4, true);
+      if (pending.length < 8 + headerLength) return;
+      header = JSON.parse(new TextDecoder().decode(pending.subarray(8, 8 + headerLength)));
+      const [, nx, ny] = header.shape;
+      cellBytes = cellSize(header);
+      frameSize = nx * ny * cellBytes;
+      pending = pending.slice(8 + headerLength);
+      onHeader(header);
+    }
+
+    for (let frame = nextFrame(); frame; frame = nextFrame()) {
+      onFrame(frame);
+    }
+  };
+};
@@ -0,0 +1,116 @@
+"""store history outputs once per distinct content
+
+Revision ID: 5b0c7e2a9d41
+Revises: 38416ff576ce
+Create Date: 2026-10-17 10:12:40.518203
+
+"""
+import hashlib
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0c7e2a9d41'
+down_revision = '38416ff576ce'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+history = sa.table('history',
+    sa.column('id', sa.Integer),
+    sa.column('user_id', sa.Integer),
+    sa.column('input', sa.Text),
+    sa.column('output', sa.Text),
+    sa.column('output_hash', sa.String),
+    sa.column('size', sa.Integer)
+)
+history_output = sa.table('history_output',
+    sa.column('hash', sa.String),
+    sa.column('data', sa.Text),
+    sa.column('size', sa.Integer),
+    sa.column('ref_count', sa.Integer)
+)
+user = sa.table('user',
+    sa.column('id', sa.Integer),
+    sa.column('storage_used', sa.Integer)
+)
+
+
+def upgrade():
+    op.create_table('history_output',
+        sa.Column('hash', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.Text(), nullable=True),
+        sa.Column('size', sa.Integer(), nullable=True),
+        sa.Column('ref_count', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('hash')
+    )
+    with op.batch_alter_table('history') as batch_op:
+        batch_op.add_column(sa.Column('output_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_history_output_hash'), ['output_hash'], unique=False)
+        batch_op.create_foreign_key('fk_history_output', 'history_output', ['output_hash'], ['hash'])
+
+    # Move existing outputs into history_output, a batch of rows at a time, and
+    # charge each user once per distinct output
+    bind = op.get_bind()
+    ref_counts = {}
+    charged = set()  # (user_id, hash)
+    storage = {}
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(history.c.id, history.c.user_id, history.c.input, history.c.output)
+            .where(history.c.id > last_id).order_by(history.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        for row_id, user_id, input_text, output_text in rows:
+            last_id = row_id
+            size = len((input_text or '').encode('utf-8'))
+            if output_text is None:
+                bind.execute(history.update().where(history.c.id == row_id).values(size=size))
+                storage[user_id] = storage.get(user_id, 0) + size
+                continue
+            output_hash = hashlib.sha256(output_text.encode('utf-8')).hexdigest()
+            output_size = len(output_text.encode('utf-8'))
+            if output_hash not in ref_counts:
+                bind.execute(history_output.insert().values(hash=output_hash, data=output_text, size=output_size, ref_count=0))
+                ref_counts[output_hash] = 0
+            ref_counts[output_hash] += 1
+            if (user_id, output_hash) not in charged:
+                charged.add((user_id, output_hash))
+                size += output_size
+            bind.execute(
+                history.update().where(history.c.id == row_id)
+                .values(output_hash=output_hash, output=None, size=size)
+            )
+            storage[user_id] = storage.get(user_id, 0) + size
+
+    for output_hash, ref_count in ref_counts.items():
+        bind.execute(history_output.update().where(history_output.c.hash == output_hash).values(ref_count=ref_count))
+    for user_id, storage_used in storage.items():
+        bind.execute(user.update().where(user.c.id == user_id).values(storage_used=storage_used))
+
+
+def downgrade():
+    # Copy the outputs back into their rows; sizes are brought back in line by
+    # POST /api/history/storage/recalculate
+    bind = op.get_bind()
+    last_hash = ''
+    while True:
+        outputs = bind.execute(
+            sa.select(history_output.c.hash, history_output.c.data)
+            .where(history_output.c.hash > last_hash).order_by(history_output.c.hash).limit(BATCH_SIZE)
+        ).fetchall()
+        if not outputs:
+            break
+        for output_hash, data in outputs:
+            last_hash = output_hash
+            bind.execute(history.update().where(history.c.output_hash == output_hash).values(output=data))
+
+    with op.batch_alter_table('history') as batch_op:
+        batch_op.drop_constraint('fk_history_output', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_history_output_hash'))
+        batch_op.drop_column('output_hash')
+    op.drop_table('history_output')
@@ -0,0 +1,24 @@
+"""history add elapsed
+
+Revision ID: 8c1d4e6f2a73
+Revises: 5b0c7e2a9d41
+Create Date: 2026-10-17 16:05:12.341877
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d4e6f2a73'
+down_revision = '5b0c7e2a9d41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('history', sa.Column('elapsed', sa.Float(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('history', 'elapsed')